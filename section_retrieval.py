@@ -10,7 +10,8 @@ from bs4 import BeautifulSoup, NavigableString
 
 from get_option_for_query import get_encodings_for_string, get_content_from_response, limited_tokens_request
 
-from streamlit.civix.embeddings_search.new_search import TextRanker
+from streamlit.civix.embeddings_search.ranker_registry import get_text_ranker
+from streamlit.civix.embeddings_search.score_fusion import fuse_ranked_lists
 
 
 # THIS CONTAINS IN PROGRESS CODE FOR HYBRID OF SIMILARITY SEARCH AND OPTIONS RANKING.
@@ -79,45 +80,30 @@ def get_top_average_df(id, act_name, query):
     sections_list = get_sections_list(contents_list)
             
     strings, relatedness = get_top_by_similarity(id, sections_list, query, top_n=20)
-    strings = list(strings)
-    strings.reverse()
+    ranked_strings = list(strings)
+    strings = ranked_strings[::-1]
     # TODO TODO Note that doing this with the actual section text would probably be better
     # See get_query_results function in statute_app.py
     best_sections = get_best_sections(act_name, strings, query, randomize=False, limit=len(strings) * 2)
 
     # print("Running weighted average")
     relatedness_weight = 0.1
-    df = weighted_average(strings, relatedness, best_sections, weight=relatedness_weight)
+    # Only the vector search candidates are scored, so a heading the LLM invented or reformatted is dropped
+    candidates = set(ranked_strings)
+    best_sections = [section for section in best_sections if section in candidates]
+    # LLM order carries no scores, so it is blended by rank
+    fused_strings, fused_scores = fuse_ranked_lists(
+        [(ranked_strings, relatedness), (best_sections, None)],
+        weights=[relatedness_weight, 1 - relatedness_weight],
+        method="weighted",
+    )
+    df = pd.DataFrame({'String': fused_strings, 'Weighted_Average': fused_scores})
     return df
 
 
-def normalize_min_max(data):
-    return (data - data.min()) / (data.max() - data.min())
-
-
-def weighted_average(strings, relatedness, relevance_order, weight=.5):
-    # Convert relevance rank into relevance score
-    relevance_scores = [1 - normalize_min_max(pd.Series(range(len(relevance_order))))[i] for i in range(len(relevance_order))]
-
-    # Create a dictionary of strings and their relevance scores
-    relevance_dict = dict(zip(relevance_order, relevance_scores))
-
-    # Prepare a dataframe
-    df = pd.DataFrame({
-        'String': strings,
-        'Relatedness': normalize_min_max(pd.Series(relatedness)),
-        'Relevance': [relevance_dict.get(s, 0) for s in strings],  # 0 relevance for strings not found in relevance_ranked
-    })
-
-    # Calculate Weighted Average
-    df['Weighted_Average'] = weight * df['Relatedness'] + (1 - weight) * df['Relevance']
-    # Sort by Weighted Average and return the sorted dataframe
-    return df.sort_values('Weighted_Average', ascending=False)
-
-
 def get_top_by_similarity(id, contents_list, query, top_n=10):
 
-    text_ranker = TextRanker(embedding_filename=f"{id}-section_headings.csv", strings=contents_list)
+    text_ranker = get_text_ranker(f"{id}-section_headings.csv", contents_list)
 
     strings, relatedness = text_ranker.execute_query(query, top_n=top_n)
     # print(f"Strings: {strings}\nRelatedness: {relatedness}")
@@ -1,4 +1,7 @@
 import re
+import time
+
+startup_time = time.perf_counter()
 
 import random
 
@@ -8,10 +11,15 @@ from choose_law import choose_bc_statute, choose_multiple_bc_statutes
 
 from get_option_for_query import get_multiple_options_for_query_from_list
 
-from streamlit.civix.data import load_statute_dataframe
+from streamlit.civix.data import get_statute_catalog, get_statute_currency_date
 from streamlit.civix.embeddings_search.search import get_law_names_by_relatedness
-from streamlit.civix.embeddings_search.statute_dict import get_statute_dict_from_url, create_statute_markdown, create_section_markdown
-from streamlit.civix.embeddings_search.new_search import TextRanker
+from streamlit.civix.embeddings_search.statute_dict import get_statute_dict_from_url, get_statute_outline, create_markdown_from_outline, create_section_markdown
+from streamlit.civix.embeddings_search.ranker_registry import get_text_ranker
+from streamlit.civix.embeddings_search.corpus_index import get_corpus_index
+from streamlit.civix.embeddings_search.name_resolver import get_name_resolver
+from streamlit.civix.embeddings_search.embedding_store import get_current_version
+from streamlit.civix.embeddings_search.score_fusion import fuse_ranked_lists
+from streamlit.civix.embeddings_search.result_cache import QueryResult, get_default_result_cache
 
 from question_answering.openai_api import get_content_from_response
 
@@ -32,6 +40,23 @@ from question_answering.chat_completion import chat_completion_request
 # Parameters for retrieving statutes
 NUMBER_OPTIONS_TO_RETRIEVE = 10
 NUMBER_OPTIONS_TO_SHOW = 5
+# Parameters for searching sections across all statutes
+NUMBER_SECTIONS_TO_RETRIEVE = 10
+CORPUS_SEARCH_FILTERS = {"repealed": False}  # see MetadataIndex in metadata_filter.py for the fields
+# Parameters for ranking sections within a statute: embedding similarity, optionally fused with
+# BM25 keyword matches. Off until hybrid ranking has been evaluated against embedding similarity alone
+HYBRID_SEARCH = False
+HYBRID_FUSION_METHOD = "rrf"
+HYBRID_WEIGHTS = [1.0, 1.0]  # dense, keyword
+
+SEE_MORE_SEED_SECTIONS = 3  # top results whose nearest sections "See more sections" shows
+SEE_MORE_SECTIONS = 10
+
+# ------------ STARTUP ------------ #
+# Loads the statute catalog at startup rather than on the first query, and reports the startup time
+import_seconds = time.perf_counter() - startup_time
+get_statute_catalog()
+print(f"Started in {time.perf_counter() - startup_time:.2f} s ({import_seconds:.2f} s importing)")
 
 
 @cl.on_chat_start
@@ -104,6 +129,9 @@ def get_statute_options_message(statute_options):
         cl.Action(name="change_options",
                   value="rerank_options",
                   label="Rerank options"),
+        cl.Action(name="search_all_sections",
+                  value="search_all_sections",
+                  label="Search all sections"),
         cl.Action(name="query_statutes",
                   value="search_statutes",
                   label="New search"),
@@ -165,6 +193,40 @@ async def statute_options_button(action):
 
 
 
+@cl.action_callback("search_all_sections")
+async def search_all_sections_button(action):
+    query = cl.user_session.get("query")
+    corpus_index = get_corpus_index()
+
+    if corpus_index is None:
+        await cl.Message(
+            content="The all-statutes section index has not been built. Please choose a statute instead."
+        ).send()
+        return
+
+    results = corpus_index.search(query, top_n=NUMBER_SECTIONS_TO_RETRIEVE, filters=CORPUS_SEARCH_FILTERS)
+    cl.user_session.set("corpus_results", results)
+
+    # Offer each statute in the results, in order of its best section
+    actions = []
+    for name in dict.fromkeys(result["name"] for result in results):
+        actions.append(
+            cl.Action(name="statute_choice", value=name, label=name))
+    actions.append(
+        cl.Action(name="back_to_options", value="back", label="Back"))
+
+    elements = [
+        cl.Text(name="Sections From All Statutes",
+                content=get_corpus_sections_string(results),
+                display="side"),
+    ]
+
+    await cl.Message(
+        content=f"The most responsive sections across all statutes:\n{format_corpus_results(results)}\n* Sections From All Statutes",
+        elements=elements,
+        actions=actions).send()
+
+
 @cl.action_callback("back_to_options")
 async def back_to_options_button(action):
     statute_options = cl.user_session.get("statute_options")
@@ -201,9 +263,17 @@ async def statute_choice_button(action):
 
 
 async def load_statute_by_name(name):
+    # Typed names may be partial or misspelled, so resolve them to a catalog name first
+    resolved_name = get_name_resolver().resolve_one(name)
+    if resolved_name is None:
+        await send_name_suggestions(name)
+        return
+    if resolved_name != name:
+        await cl.Message(content=f"Loading {resolved_name}.").send()
+        name = resolved_name
+
     cl.user_session.set("chosen_statute", name)
-    df = load_statute_dataframe()
-    citations = get_citations_by_name(name, df)
+    citations = get_citations_by_name(name)
 
     try:
         if len(citations) > 1:
@@ -227,6 +297,19 @@ async def load_statute_by_name(name):
     except TypeError:
         await cl.Message(content="Nothing found. Please use the buttons above to try again.")
 
+async def send_name_suggestions(name):
+    names, _ = get_name_resolver().resolve(name, top_n=NUMBER_OPTIONS_TO_SHOW)
+    if not names:
+        await cl.Message(content="Nothing found. Please use the buttons above to try again.").send()
+        return
+
+    actions = []
+    for option in names:
+        actions.append(
+            cl.Action(name="statute_choice", value=option, label=option))
+    await cl.Message(content=f"No statute is named exactly \"{name}\". Did you mean:",
+                     actions=actions).send()
+
 # TODO suggested questions from query
 
 
@@ -255,9 +338,9 @@ async def get_and_handle_query():
 
     # Format actions
     actions = [
-        #cl.Action(name="section_actions",
-        #value="see_more_sections",
-        #label="See more sections"),
+        cl.Action(name="section_actions",
+                  value="see_more_sections",
+                  label="See more sections"),
         # cl.Action(name="section_actions", value="view_part_and_division_headings", label="View part and division headings"),
         # cl.Action(name="section_actions",
         #value="recommend_section",
@@ -346,7 +429,45 @@ async def ask_another():
 
 
 async def see_more_sections():
-    await cl.Message(content="Not implemented", author="see_more_sections").send()
+    section_results = cl.user_session.get("section_results")
+    text_ranker = section_results["text_ranker"]
+    seeds = section_results["strings"][:SEE_MORE_SEED_SECTIONS]
+    statute_sections_string = section_results["statute_sections_string"]
+
+    # Sections near the top results in the precomputed section graph, skipping those already shown
+    shown = [string for string in section_results["strings"] if string in statute_sections_string]
+    related_strings, _ = text_ranker.get_related_sections(
+        seeds, top_n=SEE_MORE_SECTIONS, exclude=shown)
+    related_results = get_related_corpus_results(section_results, seeds)
+
+    if not related_strings and not related_results:
+        await cl.Message(content="No related sections were found.",
+                         author="see_more_sections").send()
+        return
+
+    side_elements = [
+        cl.Text(name="Related Sections",
+                content=get_statute_sections_string(related_strings),
+                display="side"),
+    ]
+    if related_results:
+        side_elements.append(
+            cl.Text(name="Related Sections From Other Statutes",
+                    content=get_corpus_sections_string(related_results),
+                    display="side"))
+
+    content = "Sections related to the most responsive sections:\n"
+    for number, heading in get_number_heading_list(related_strings):
+        content += f"{number}  {heading}\n"
+    if related_results:
+        content += f"\nIn other statutes:\n{format_corpus_results(related_results)}"
+    content += "\nResults:\n"
+    for element in side_elements:
+        content += f"* {element.name}\n"
+
+    await cl.Message(content=content,
+                     elements=side_elements,
+                     author="see_more_sections").send()
     return
 
 
@@ -477,28 +598,89 @@ def rerank_options(query, statute_options):
 
 
 # ---------- disambiguate by citation ---------- #
-def get_citations_by_name(name, df):
-    df = load_statute_dataframe()
-    filtered_df = df[df['name'] == name]
-    if not filtered_df.empty:
-        citations = filtered_df['citation'].tolist()
+def get_citations_by_name(name):
+    statutes = get_statute_catalog().find_by_name(name, include_repealed=False)
+    if statutes:
+        citations = [statute['citation'] for statute in statutes]
         return citations
 
 
 # --------- for specific statute questions --------- #
 def get_query_results(name, citation, query):
+    # The same question about the same act reuses the ranking from any earlier session
+    act_id = get_act_id(name, citation)
+    currency_date = get_statute_currency_date()
+    result_cache = get_default_result_cache()
+    if act_id is not None:
+        cached_result = result_cache.get(act_id, currency_date, query["content"])
+        if cached_result is not None:
+            results = get_cached_query_results(name, citation, query, cached_result)
+            if results is not None:
+                return results
+
     statute_dict = get_statute_dict(name, citation)
-    statute_md = create_statute_markdown(statute_dict)
+    section_numbers = list(statute_dict["sections"])
     statute_sections = get_statute_sections(statute_dict)
+    outline = get_statute_outline(statute_dict)
+    statute_md = create_markdown_from_outline(
+        outline, dict(zip(section_numbers, statute_sections)))
+    embedding_filename = f"{statute_dict['title']}, {statute_dict['neutral_citation']}.csv"
 
-    text_ranker = TextRanker(
-        f"{statute_dict['title']}, {statute_dict['neutral_citation']}.csv",
-        statute_sections)
+    # Shared across sessions, so the statute's index is only loaded once
+    text_ranker = get_text_ranker(embedding_filename, statute_sections)
 
     strings, relatedness = text_ranker.execute_query(
         query["content"], top_n=len(statute_sections))
+    if HYBRID_SEARCH:
+        keyword_strings, keyword_scores = text_ranker.strings_ranked_by_keywords(
+            query["content"], top_n=len(statute_sections))
+        strings, relatedness = fuse_ranked_lists(
+            [(strings, relatedness), (keyword_strings, keyword_scores)],
+            weights=HYBRID_WEIGHTS,
+            method=HYBRID_FUSION_METHOD)
+
+    top_headings_list = get_query_top_headings_list(query, strings)
+
+    if act_id is not None:
+        section_ids = {text: i for i, text in enumerate(text_ranker.section_texts)}
+        result_cache.put(act_id, currency_date, query["content"], QueryResult(
+            embedding_filename, outline, section_numbers,
+            [section_ids[string] for string in strings], relatedness,
+            top_headings_list, text_ranker.index_version))
+
+    return format_query_results(name, citation, query, statute_dict, statute_md,
+                                statute_sections, section_numbers, text_ranker,
+                                strings, relatedness, top_headings_list)
+
+
+def get_cached_query_results(name, citation, query, cached_result):
+    if cached_result.index_version != get_current_version():
+        # Ranked on an index version that has since been replaced
+        return None
+    # Sections are read back from the statute's ranker rather than refetched
+    text_ranker = get_text_ranker(cached_result.embedding_filename, [])
+    statute_sections = list(text_ranker.section_texts)
+    if len(statute_sections) != len(cached_result.section_numbers):
+        # The embeddings were rebuilt since the result was cached
+        return None
+
+    section_numbers = list(cached_result.section_numbers)
+    statute_md = create_markdown_from_outline(
+        cached_result.outline, dict(zip(section_numbers, statute_sections)))
+    strings = [statute_sections[i] for i in cached_result.section_ids]
+
+    return format_query_results(name, citation, query, None, statute_md,
+                                statute_sections, section_numbers, text_ranker,
+                                strings, list(cached_result.relatedness),
+                                list(cached_result.top_headings))
 
-    top_headings_string = get_top_headings_string(query, strings)
+
+def format_query_results(name, citation, query, statute_dict, statute_md,
+                         statute_sections, section_numbers, text_ranker, strings,
+                         relatedness, top_headings_list):
+    top_headings_string = ""
+    for item in top_headings_list:
+        top_headings_string += f"{item}\n"
     statute_sections_string = get_statute_sections_string(strings)
 
     results = {
@@ -508,6 +690,7 @@ def get_query_results(name, citation, query):
         "statute_dict": statute_dict,
         "statute_md": statute_md,
         "statute_sections": statute_sections,
+        "section_numbers": section_numbers,
         "text_ranker": text_ranker,
         "strings": strings,
         "relatedness": relatedness,
@@ -518,10 +701,30 @@ def get_query_results(name, citation, query):
     return results
 
 
+def get_related_corpus_results(section_results, strings):
+    # Sections of other statutes near the given ones, if the corpus section graph is built
+    corpus_index = get_corpus_index()
+    if corpus_index is None:
+        return []
+    section_numbers = dict(zip(section_results["statute_sections"],
+                               section_results["section_numbers"]))
+    related = {}
+    for string in strings:
+        if string not in section_numbers:
+            continue
+        for result in corpus_index.get_related_sections(
+                section_results["citation"], section_numbers[string],
+                top_n=SEE_MORE_SECTIONS):
+            key = (result["act_id"], result["section"])
+            if key not in related or result["relatedness"] > related[key]["relatedness"]:
+                related[key] = result
+    return sorted(related.values(), key=lambda result: result["relatedness"],
+                  reverse=True)[:SEE_MORE_SECTIONS]
+
+
 def get_text_ranker_for_statute(name, citation):
-    df = load_statute_dataframe()
     # Lookup heading url by chosen name
-    url = get_url(name, citation, df)
+    url = get_url(name, citation)
     statute_dict = get_statute_dict_from_url(url)
 
     statute_sections = []
@@ -530,14 +733,14 @@ def get_text_ranker_for_statute(name, citation):
         section_md = create_section_markdown(value)
         statute_sections.append(section_md)
 
-    text_ranker = TextRanker(
+    text_ranker = get_text_ranker(
         f"{statute_dict['title']}, {statute_dict['neutral_citation']}.csv",
         statute_sections)
 
     return text_ranker
 
 
-def get_top_headings_string(query, strings):
+def get_query_top_headings_list(query, strings):
     number_heading_list = get_number_heading_list(strings)
     # print(number_heading_list)
 
@@ -561,39 +764,46 @@ def get_top_headings_string(query, strings):
     top_headings_list = get_top_headings_list(top_headings,
                                               number_heading_list)
     print(f"Top headings list: {top_headings_list}")
-    # DECIDE WHAT TO DO WITH THIS
-    top_headings_string = ""
-    for item in top_headings_list:
-        top_headings_string += f"{item}\n"
-
-    return top_headings_string
+    return top_headings_list
 
 
 # ------------- DATA FORMATTING UTILITIES ------------ #
-def get_url(name, citation, df):
-    filtered_df = df[(df['name'] == name) & (df['citation'] == citation)]
-    if not filtered_df.empty:
-        url = filtered_df.iloc[0]['url']
+def get_url(name, citation):
+    statute = get_statute_catalog().find_statute(name, citation, include_repealed=False)
+    if statute:
+        url = statute['url']
         return url
     else:
         return None
 
 
+def get_act_id(name, citation):
+    statute = get_statute_catalog().find_statute(name, citation, include_repealed=False)
+    if statute:
+        return statute['act_id']
+    else:
+        return None
+
+
 def get_statute_dict(name, citation):
-    df = load_statute_dataframe()
-    url = get_url(name, citation, df)
+    url = get_url(name, citation)
 
     statute_dict = get_statute_dict_from_url(url)
     return statute_dict
 
 
 def get_name_url_list_for_statutes(statutes: list):
-    df = load_statute_dataframe()
+    catalog = get_statute_catalog()
+    # In catalog order rather than the order of statutes
+    positions = sorted({
+        position
+        for name in statutes
+        for position in catalog.get_positions("name", name, include_repealed=False)
+    })
 
     filtered_list = [
-        (name, citation, url)
-        for name, citation, url in zip(df['name'], df['citation'], df['url'])
-        if name in statutes
+        (catalog.records[position]['name'], catalog.records[position]['citation'], catalog.records[position]['url'])
+        for position in positions
     ]
     return filtered_list
 
@@ -606,6 +816,20 @@ def format_markdown_statute_list(statutes):
     return statute_list
 
 
+def format_corpus_results(results):
+    corpus_results = ""
+    for result in results:
+        corpus_results += f"s. {result['section']} {result['name']}, {result['citation']}\n"
+    return corpus_results
+
+
+def get_corpus_sections_string(results):
+    corpus_sections_string = ""
+    for result in results:
+        corpus_sections_string += f"**{result['name']}, {result['citation']}**\n\n{result['text']}\n\n"
+    return corpus_sections_string
+
+
 def get_statute_sections(statute_dict):
     statute_sections = []
 
@@ -4,6 +4,8 @@ import streamlit.components.v1 as components
 
 from civix.data import load_statute_dataframe, get_statute_currency_date
 
+from civix.catalog_search import get_catalog_search
+
 from civix.document import Document
 
 from civix.retrieve_statute import get_statute_dict_by_info
@@ -49,13 +51,17 @@ df = load_statute_dataframe(include_repealed=include_repealed, exclude_act_id =
 name_filter = st.text_input('Filter by name', '')
 citation_filter = st.text_input("Filter by citation", "")
 
+# Ranked prefix, substring and, failing those, fuzzy matches from the catalog's autocomplete indexes.
+# Their positions in the catalog are the dataframe's index.
+filtered_df = df
+
 if name_filter:
-    filtered_df = df.loc[df['name'].str.contains(name_filter, case=False)]
-else:
-    filtered_df = df
+    positions = get_catalog_search().get_positions(name_filter, "name", include_repealed=include_repealed)
+    filtered_df = filtered_df.loc[[position for position in positions if position in filtered_df.index]]
 
 if citation_filter:
-    filtered_df = df.loc[df["citation"].str.contains(citation_filter, case=False)]
+    positions = get_catalog_search().get_positions(citation_filter, "citation", include_repealed=include_repealed)
+    filtered_df = filtered_df.loc[[position for position in positions if position in filtered_df.index]]
 
 
 st.dataframe(filtered_df)
@@ -0,0 +1,99 @@
+import json
+import mmap
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# Compact binary form of the statute catalog, written next to each all_statutes json file.
+# Records are a packed struct array: each text field is an int32 id into a table of
+# interned strings, so a name shared by several statutes is stored once, and
+# repealed is one byte. The string table is one UTF-8 blob of NUL-separated strings, decoded
+# and split in two calls. The file is memory mapped and the records read as a numpy view.
+#
+# Layout: MAGIC, then n_records, n_strings and blob length as little-endian uint64, then
+# the records and the blob.
+
+MAGIC = b"CIVIX CATALOG 1\n"  # 16 bytes, keeping the header aligned
+CATALOG_EXTENSION = ".catalog"
+STRING_FIELDS = ("name", "citation", "directory_id", "act_id", "url")
+BOOLEAN_FIELDS = ("repealed",)
+FIELDS = ("name", "citation", "directory_id", "act_id", "repealed", "url")  # the order of the json records
+RECORD_DTYPE = np.dtype([(field, "<i4") for field in STRING_FIELDS] + [(field, "u1") for field in BOOLEAN_FIELDS])
+HEADER_DTYPE = np.dtype([("n_records", "<u8"), ("n_strings", "<u8"), ("blob_length", "<u8")])
+MISSING = -1  # string id of a missing value
+
+
+def get_catalog_path(json_path: str) -> str:
+    """Returns the binary catalog path for an all_statutes json file."""
+    return f"{os.path.splitext(json_path)[0]}{CATALOG_EXTENSION}"
+
+
+def write_catalog(path: str, records: List[dict]):
+    """Writes records as a binary catalog, atomically replacing any existing file."""
+    string_ids = {}
+    packed = np.zeros(len(records), dtype=RECORD_DTYPE)
+    for field in STRING_FIELDS:
+        packed[field] = [MISSING if record.get(field) is None else string_ids.setdefault(record[field], len(string_ids)) for record in records]
+    for field in BOOLEAN_FIELDS:
+        packed[field] = [bool(record.get(field)) for record in records]
+
+    blob = "\0".join(string_ids).encode("utf-8")
+    header = np.array([(len(records), len(string_ids), len(blob))], dtype=HEADER_DTYPE)
+
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(MAGIC)
+        f.write(header.tobytes())
+        f.write(packed.tobytes())
+        f.write(blob)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_catalog(path: str) -> Tuple[List[dict], Dict[str, np.ndarray]]:
+    """
+    Reads a binary catalog.
+
+    Returns:
+    Tuple[List[dict], Dict[str, np.ndarray]]: The records as dictionaries, and each field as a column, ready for a DataFrame.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a statute catalog")
+
+    position = len(MAGIC)
+    header = np.frombuffer(buffer, dtype=HEADER_DTYPE, count=1, offset=position)[0]
+    position += HEADER_DTYPE.itemsize
+    n_records, n_strings, blob_length = (int(value) for value in header)
+    packed = np.frombuffer(buffer, dtype=RECORD_DTYPE, count=n_records, offset=position)
+    position += RECORD_DTYPE.itemsize * n_records
+    strings = buffer[position:position + blob_length].decode("utf-8").split("\0") if n_strings else []
+    strings = np.array(strings + [None], dtype=object)
+    # MISSING (-1) indexes the trailing None
+    columns = {field: strings[packed[field]] if field in STRING_FIELDS else packed[field].astype(bool) for field in FIELDS}
+    # Dictionary displays build much faster than dict(zip(...)) per record
+    records = [
+        {"name": name, "citation": citation, "directory_id": directory_id, "act_id": act_id, "repealed": repealed, "url": url}
+        for name, citation, directory_id, act_id, repealed, url in zip(*(columns[field].tolist() for field in FIELDS))
+    ]
+    return records, columns
+
+
+def load_or_convert_catalog(json_path: str) -> Tuple[List[dict], Optional[Dict[str, np.ndarray]]]:
+    """
+    Loads the binary catalog for an all_statutes json file, writing it from the json first
+    if it is missing or older. Falls back to the json alone if the catalog can't be written.
+    """
+    catalog_path = get_catalog_path(json_path)
+    if os.path.exists(catalog_path) and os.path.getmtime(catalog_path) >= os.path.getmtime(json_path):
+        return read_catalog(catalog_path)
+
+    with open(json_path, "r") as f:
+        records = json.load(f)
+    try:
+        write_catalog(catalog_path, records)
+    except OSError as e:
+        print(f"Could not write statute catalog {catalog_path}: {e}")
+        return records, None
+    return read_catalog(catalog_path)
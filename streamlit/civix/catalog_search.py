@@ -0,0 +1,169 @@
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+try:
+    from .data import StatuteCatalog, get_statute_catalog
+    from .trigram_index import TrigramIndex, normalize_text
+except ImportError:
+    from data import StatuteCatalog, get_statute_catalog
+    from trigram_index import TrigramIndex, normalize_text
+
+
+# Autocomplete over statute names and citations. Every suffix of each normalized string is
+# kept in one sorted array, so the strings containing a query are the suffixes between two
+# binary searches, and where the suffix starts tells whether the match is the whole string,
+# a prefix of it, a prefix of one of its words or a substring. When the query is found
+# literally nowhere, e.g. because of a typo, the character trigram index supplies fuzzy matches.
+# Matches rank by kind, then shorter strings (or, for fuzzy matches, higher trigram scores)
+# first, then catalog order. Literal matches of each query are cached.
+
+MATCH_KINDS = ("exact", "prefix", "word_prefix", "substring", "fuzzy")
+SEARCH_FIELDS = ("name", "citation")
+MIN_FUZZY_SCORE = 0.3
+CACHED_QUERIES = 1024  # literal matches kept per index, so retyping or deleting a character costs a lookup
+CONFIDENT_FUZZY_SCORE = 0.6  # a fuzzy match get_statute_dict_by_info accepts for a statute
+
+_catalog_search = None
+
+
+class AutocompleteIndex:
+    """
+    Sorted suffix array over short strings, with a trigram index for fuzzy matches.
+
+    Parameters:
+    strings (List[str]): The strings to search. A missing string (None) never matches.
+    """
+    def __init__(self, strings: List[Optional[str]]):
+        self.texts = [normalize_text(string) if isinstance(string, str) else "" for string in strings]
+        suffixes = sorted(
+            (text[position:], string_id, position)
+            for string_id, text in enumerate(self.texts)
+            for position in range(len(text))
+            if text[position] != " "
+        )
+        self.suffixes = [suffix for suffix, _, _ in suffixes]
+        self.suffix_ids = [string_id for _, string_id, _ in suffixes]
+        # Match kind of a query found at each suffix: prefix (or exact, told apart by length), word prefix or substring
+        self.suffix_kinds = [1 if position == 0 else 2 if self.texts[string_id][position - 1] == " " else 3 for _, string_id, position in suffixes]
+        self.trigram_index = TrigramIndex([string if isinstance(string, str) else "" for string in strings])
+        self.get_literal_matches = lru_cache(maxsize=CACHED_QUERIES)(self.get_literal_matches)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def get_literal_matches(self, query: str) -> Tuple[Tuple[int, str, float], ...]:
+        """Returns every string containing the normalized query, ranked, as (string id, match kind, 1.0)."""
+        if not query:
+            return ()
+        start = bisect_left(self.suffixes, query)
+        end = bisect_left(self.suffixes, query[:-1] + chr(ord(query[-1]) + 1), start)
+        best_kinds = {}
+        # Suffixes come in text order, not kind order, so keep each string's best kind
+        for string_id, kind in zip(self.suffix_ids[start:end], self.suffix_kinds[start:end]):
+            if kind < best_kinds.get(string_id, 4):
+                best_kinds[string_id] = kind
+        for string_id, kind in best_kinds.items():
+            if kind == 1 and len(self.texts[string_id]) == len(query):
+                best_kinds[string_id] = 0
+        ranked = sorted(best_kinds, key=lambda string_id: (best_kinds[string_id], len(self.texts[string_id]), string_id))
+        return tuple((string_id, MATCH_KINDS[best_kinds[string_id]], 1.0) for string_id in ranked)
+
+    def search(self, query: str, top_n: Optional[int] = 10, fuzzy: bool = True, min_score: float = MIN_FUZZY_SCORE) -> List[Tuple[int, str, float]]:
+        """
+        Returns up to top_n matches, all of them if top_n is None, best first, as
+        (string id, match kind, score). Literal matches score 1; fuzzy matches their trigram
+        score, and are only added when the query matches nothing literally.
+        """
+        matches = list(self.get_literal_matches(normalize_text(query)))
+        if not matches and fuzzy:
+            ids, scores = self.trigram_index.search(query, top_n=top_n if top_n is not None else len(self), min_score=min_score)
+            matches = [(int(string_id), "fuzzy", float(score)) for string_id, score in zip(ids, scores)]
+        return matches[:top_n] if top_n is not None else matches
+
+
+class CatalogSearch:
+    """
+    Autocomplete indexes over the names and citations of a statute catalog. String ids are
+    the statutes' catalog positions, which are also the index of the catalog's dataframes.
+    """
+    def __init__(self, catalog: StatuteCatalog):
+        self.catalog = catalog
+        self.indexes = {field: AutocompleteIndex([record[field] for record in catalog.records]) for field in SEARCH_FIELDS}
+
+    def search(self, query: str, fields: Iterable[str] = SEARCH_FIELDS, top_n: Optional[int] = 10, include_repealed: bool = True, fuzzy: bool = True) -> List[Tuple[int, str, float]]:
+        """
+        Returns up to top_n statutes matching query in any of fields, best first, as
+        (catalog position, match kind, score). A statute matched in several fields keeps its best match.
+        """
+        fields = tuple(fields)
+        if len(fields) == 1:
+            # Already ranked, with one match per statute
+            matches = self.indexes[fields[0]].search(query, top_n=None, fuzzy=fuzzy)
+            if not include_repealed:
+                matches = [match for match in matches if not self.catalog.records[match[0]]["repealed"]]
+            return matches[:top_n] if top_n is not None else matches
+
+        best = {}
+        for field in fields:
+            self.add_best_matches(best, field, self.indexes[field].search(query, top_n=None, fuzzy=False), include_repealed)
+        # Fuzzy matches only when no field has a literal match
+        if not best and fuzzy:
+            for field in fields:
+                self.add_best_matches(best, field, self.indexes[field].search(query, top_n=None), include_repealed)
+        ranked = sorted(best, key=lambda position: (best[position][0], position))
+        ranked = ranked[:top_n] if top_n is not None else ranked
+        return [(position, best[position][1], best[position][2]) for position in ranked]
+
+    def add_best_matches(self, best: dict, field: str, matches: List[Tuple[int, str, float]], include_repealed: bool):
+        for position, kind, score in matches:
+            if not include_repealed and self.catalog.records[position]["repealed"]:
+                continue
+            rank = (MATCH_KINDS.index(kind), -score, len(self.indexes[field].texts[position]))
+            if position not in best or rank < best[position][0]:
+                best[position] = (rank, kind, score)
+
+    def get_positions(self, query: str, field: str, include_repealed: bool = True) -> List[int]:
+        """Returns the catalog positions of every statute matching query in one field, best first, for filtering a dataframe."""
+        return [position for position, _, _ in self.search(query, fields=(field,), top_n=None, include_repealed=include_repealed)]
+
+    def find_statutes(self, query: str, top_n: int = 10, include_repealed: bool = True) -> List[dict]:
+        return [self.catalog.records[position] for position, _, _ in self.search(query, top_n=top_n, include_repealed=include_repealed)]
+
+
+def get_catalog_search() -> Optional[CatalogSearch]:
+    """Returns the autocomplete indexes of the shared statute catalog, rebuilt when the catalog is reloaded."""
+    global _catalog_search
+    catalog = get_statute_catalog()
+    if catalog is None:
+        return None
+    catalog_search = _catalog_search
+    if catalog_search is None or catalog_search.catalog is not catalog:
+        catalog_search = CatalogSearch(catalog)
+        _catalog_search = catalog_search
+    return catalog_search
+
+
+def benchmark_catalog_search(repeat: int = 20):
+    """Times autocomplete queries against filtering the dataframe with str.contains."""
+    catalog_search = get_catalog_search()
+    df = catalog_search.catalog.get_dataframe(include_repealed=True)
+    queries = ["t", "ten", "tenancy", "residential tenancy act", "strata prop", "motor veh", "sbc 2002", "c. 78", "residental tenency", "wildfire"]
+    for label, function in (
+        ("str.contains", lambda query: df.loc[df["name"].str.contains(query, case=False, regex=False)]),
+        ("autocomplete", lambda query: catalog_search.get_positions(query, "name")),
+    ):
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            for query in queries:
+                function(query)
+        print(f"{label}: {(time.perf_counter() - start_time) / (repeat * len(queries)) * 1e6:.1f} us per query")
+
+    for query in queries:
+        matches = catalog_search.search(query, top_n=3)
+        print(f"{query!r}: {[(catalog_search.catalog.records[position]['name'], kind) for position, kind, _ in matches]}")
+
+
+if __name__ == "__main__":
+    benchmark_catalog_search()
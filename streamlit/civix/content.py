@@ -1,3 +1,4 @@
+import re
 import requests
 from bs4 import BeautifulSoup
 
@@ -73,6 +74,24 @@ def get_civix_document_id(element):
     return None
 
 
+def get_letter_directories():
+    """
+    Returns the directory URL of every letter of the statreg index, from one request,
+    as a dictionary of letter to URL.
+    """
+    directory_url = "https://www.bclaws.gov.bc.ca/civix/content/complete/statreg/"
+    soup = fetch_and_parse_xml_data(directory_url)
+
+    letter_directories = {}
+    for dir_tag in soup.find_all("dir"):
+        title_tag = dir_tag.find("CIVIX_DOCUMENT_TITLE")
+        match = re.fullmatch(r"-- ([A-Z]) --", title_tag.text) if title_tag else None
+        if match:
+            document_id = dir_tag.find("CIVIX_DOCUMENT_ID").text
+            letter_directories[match.group(1)] = f"http://www.bclaws.gov.bc.ca/civix/content/complete/statreg/{document_id}/"
+    return letter_directories
+
+
 def get_directory_by_letter(letter):
     print("running get_directory_by_letter")
     if not len(letter) == 1 or not letter.isalpha():
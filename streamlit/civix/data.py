@@ -1,9 +1,16 @@
 import os
-import json
 import re
+import threading
+import time
+from typing import Dict, List, Optional
 
 import pandas as pd
 
+try:
+    from .catalog_format import load_or_convert_catalog
+except ImportError:
+    from catalog_format import load_or_convert_catalog
+
 # ================= TODO ===================== #
 
 # can get rules of court index, by replacing statreg with roc - contains rules of court and related statutes. But then still access them through document statreg index
@@ -11,46 +18,156 @@ import pandas as pd
 # ================= END TODO ================= #
 
 
-def load_statute_dataframe(include_repealed = False, exclude_directory_id = True, exclude_act_id = True, exclude_url = False):
-    """
-    Loads statutes as dataframe for display, default to not including repealed statutes, ids
+# The statute catalog is loaded once per process and shared. It is reloaded only when the
+# most recent all_statutes json file changes, i.e. a newer file appears or the file is
+# rewritten. Dataframe views of it are built once per combination of options, so callers
+# get the same read-only dataframe on every call and must not modify it. Lookups by name,
+# citation or act id go through case-folded dictionary indexes built at load. The catalog
+# is read from the compact binary form in catalog_format.py, written from the json on first load.
+
+INDEXED_FIELDS = ("name", "citation", "act_id")
+STATUTE_FILENAME_PATTERN = re.compile(r"all_statutes_[0-9]{8}_[0-9]{6}_[0-9]+records\.json$")
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+class StatuteCatalog:
     """
+    The statutes of one all_statutes json file.
 
-    statute_dictionary = load_statute_dictionary()
+    Each indexed field maps its case-folded values to the positions of the records having
+    them, in catalog order. Citations and act ids are unique among statutes in force, but a
+    repealed statute can share them, so every index holds lists.
 
-    # TODO better error handline here
-    if not statute_dictionary:
+    Parameters:
+    path (str): The json file the catalog was loaded from.
+    records (List[dict]): One dictionary per statute. Treat as read-only.
+    columns (Dict[str, np.ndarray]): Optionally, each field as a column, to build dataframes from.
+    """
+    def __init__(self, path: str, records: List[dict], columns: Optional[Dict] = None):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        self.records = tuple(records)
+        self.columns = columns
+        self.load_seconds = None
+        self.frame = None
+        self.frames = {}
+        self.lock = threading.Lock()
+
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        for position, record in enumerate(self.records):
+            for field, index in self.indexes.items():
+                key = fold_value(record.get(field))
+                if key is not None:
+                    index.setdefault(key, []).append(position)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get_positions(self, field: str, value: str, include_repealed: bool = True) -> List[int]:
+        positions = self.indexes[field].get(fold_value(value), [])
+        if include_repealed:
+            return positions
+        return [position for position in positions if not self.records[position]["repealed"]]
+
+    def find_by_name(self, name: str, include_repealed: bool = True) -> List[dict]:
+        """Returns every statute with a name, ignoring case, in catalog order."""
+        return [self.records[position] for position in self.get_positions("name", name, include_repealed)]
+
+    def find_by_citation(self, citation: str, include_repealed: bool = True) -> Optional[dict]:
+        positions = self.get_positions("citation", citation, include_repealed)
+        return self.records[positions[0]] if positions else None
+
+    def find_by_act_id(self, act_id: str, include_repealed: bool = True) -> Optional[dict]:
+        positions = self.get_positions("act_id", act_id, include_repealed)
+        return self.records[positions[0]] if positions else None
+
+    def find(self, value: str, include_repealed: bool = True) -> Optional[dict]:
+        """Returns the first statute in catalog order whose name, citation or act id is value, ignoring case."""
+        positions = [position for field in INDEXED_FIELDS for position in self.get_positions(field, value, include_repealed)[:1]]
+        return self.records[min(positions)] if positions else None
+
+    def find_statute(self, name: str, citation: str, include_repealed: bool = True) -> Optional[dict]:
+        """Returns the statute with a name and citation, ignoring case."""
+        folded_citation = fold_value(citation)
+        for record in self.find_by_name(name, include_repealed):
+            if fold_value(record["citation"]) == folded_citation:
+                return record
+        return None
+
+    def get_dataframe(self, include_repealed = False, exclude_directory_id = True, exclude_act_id = True, exclude_url = False):
+        """Returns the catalog as a dataframe with the same options as load_statute_dataframe, built on first use."""
+        key = (include_repealed, exclude_directory_id, exclude_act_id, exclude_url)
+        with self.lock:
+            df = self.frames.get(key)
+            if df is None:
+                if self.frame is None:
+                    self.frame = pd.DataFrame(self.columns if self.columns is not None else list(self.records))
+                df = self.frame
+                if not include_repealed:
+                    df = df.loc[df['repealed'] == False]
+                    df = df.drop(['repealed'], axis=1)
+                excluded = [column for column, exclude in (("directory_id", exclude_directory_id), ("act_id", exclude_act_id), ("url", exclude_url)) if exclude]
+                df = df.drop(excluded, axis=1)
+                self.frames[key] = df
+        return df
+
+
+def fold_value(value) -> Optional[str]:
+    """Returns a string case-folded for lookups, or None for a missing value."""
+    return value.casefold() if isinstance(value, str) else None
+
+
+def get_statute_catalog() -> Optional[StatuteCatalog]:
+    """
+    Returns the shared statute catalog, loading it on first use and again if the most recent
+    all_statutes json file has changed since. Returns None if there is no catalog file.
+    """
+    global _catalog
+    statute_filepath = get_statute_json_filepath()
+    if statute_filepath is None:
         return None
+    catalog = _catalog
+    if catalog is not None and catalog.path == statute_filepath and catalog.mtime == os.stat(statute_filepath).st_mtime_ns:
+        return catalog
 
-    df = pd.DataFrame(statute_dictionary)
+    with _catalog_lock:
+        if _catalog is None or _catalog.path != statute_filepath or _catalog.mtime != os.stat(statute_filepath).st_mtime_ns:
+            start_time = time.perf_counter()
+            records, columns = load_or_convert_catalog(statute_filepath)
+            catalog = StatuteCatalog(statute_filepath, records, columns)
+            catalog.load_seconds = time.perf_counter() - start_time
+            print(f"Loaded statute catalog {os.path.basename(statute_filepath)}: {len(catalog)} statutes in {catalog.load_seconds * 1000:.1f} ms from {'binary' if columns is not None else 'json'}")
+            _catalog = catalog
+        return _catalog
 
-    if not include_repealed:
-        df = df.loc[df['repealed'] == False]
-        df = df.drop(['repealed'], axis=1)
 
-    if exclude_directory_id:
-        df = df.drop("directory_id", axis=1)
+def load_statute_dataframe(include_repealed = False, exclude_directory_id = True, exclude_act_id = True, exclude_url = False):
+    """
+    Loads statutes as dataframe for display, default to not including repealed statutes, ids.
+    The dataframe is shared from the catalog, so it must not be modified.
+    """
 
-    if exclude_act_id:
-        df = df.drop("act_id", axis=1)
+    catalog = get_statute_catalog()
 
-    if exclude_url:
-        df = df.drop("url", axis=1)
+    # TODO better error handline here
+    if not catalog:
+        return None
 
-    return df
+    return catalog.get_dataframe(include_repealed, exclude_directory_id, exclude_act_id, exclude_url)
 
 
 def load_statute_dictionary():
     """
-    Loads the most recent all_statutes json file from data, returns dictionary
+    Loads the statutes of the most recent all_statutes json file from data, returns a list of dictionaries
     """
 
-    statute_filepath = get_statute_json_filepath()
-    
-    with open(statute_filepath, "r") as f:
-        dictionary = json.load(f)
+    catalog = get_statute_catalog()
+    if catalog is None:
+        raise FileNotFoundError("No all_statutes json file in data")
 
-    return dictionary
+    return list(catalog.records)
 
 
 def get_statute_currency_date():
@@ -80,7 +197,8 @@ def get_statute_json_filepath():
     current_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(current_dir, 'data')
     
-    json_files = [filename for filename in os.listdir(data_dir) if filename.endswith('.json') and 'all_statutes' in filename]
+    # Only the catalogs themselves, not the listings and change reports saved alongside them
+    json_files = [filename for filename in os.listdir(data_dir) if STATUTE_FILENAME_PATTERN.match(filename)]
     json_files.sort()
     
     if json_files:
@@ -91,4 +209,42 @@ def get_statute_json_filepath():
 
 
     else:
-        return None
\ No newline at end of file
+        return None
+
+
+def benchmark_catalog_lookups(repeat: int = 1000):
+    """Times lookups through the catalog indexes against the scans they replace."""
+    catalog = get_statute_catalog()
+    df = catalog.get_dataframe(exclude_act_id=False)
+    records = list(catalog.records)
+    sample = records[::max(len(records) // 20, 1)]
+
+    def scan(value):
+        # The previous get_dictionary: lowercase three fields of every record
+        value = value.lower()
+        for item in records:
+            if any(isinstance(item[field], str) and item[field].lower() == value for field in INDEXED_FIELDS):
+                return item
+
+    def mask(name, citation):
+        # The previous get_url: boolean masks over the whole dataframe
+        return df[(df['name'] == name) & (df['citation'] == citation)]
+
+    cases = [
+        ("find by citation", lambda record: scan(record["citation"]), lambda record: catalog.find(record["citation"])),
+        ("find by act id", lambda record: scan(record["act_id"]), lambda record: catalog.find(record["act_id"])),
+        ("find by name and citation", lambda record: mask(record["name"], record["citation"]), lambda record: catalog.find_statute(record["name"], record["citation"])),
+    ]
+    for name, before, after in cases:
+        timings = []
+        for lookup in (before, after):
+            start_time = time.perf_counter()
+            for _ in range(max(repeat // len(sample), 1)):
+                for record in sample:
+                    lookup(record)
+            timings.append((time.perf_counter() - start_time) / (max(repeat // len(sample), 1) * len(sample)))
+        print(f"{name}: {timings[0] * 1e6:.1f} us scanning, {timings[1] * 1e6:.2f} us indexed ({timings[0] / timings[1]:.0f}x)")
+
+
+if __name__ == "__main__":
+    benchmark_catalog_lookups()
@@ -0,0 +1,214 @@
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_store import get_store_base_path, load_embedding_store, store_exists
+from .vector_search import VectorSearchEngine, normalize_rows, normalize_vector, select_top_k
+
+
+# Approximate nearest neighbour search with an inverted file (IVF) index. Vectors are
+# clustered with spherical k-means; a query is scored against the centroids and then only
+# against the vectors in the n_probe closest clusters. Raising n_probe trades latency for
+# recall, up to n_probe == n_lists which is an exact search.
+
+
+def main():
+    if store_exists("corpus_sections"):
+        matrix = load_embedding_store("corpus_sections").embeddings
+    else:
+        print("No corpus index found, benchmarking on random vectors")
+        matrix = np.random.default_rng(0).normal(size=(20000, 256)).astype(np.float32)
+    print_benchmark(benchmark_recall(matrix))
+
+
+def get_default_n_lists(n_vectors: int) -> int:
+    return max(1, min(n_vectors, int(4 * math.sqrt(n_vectors))))
+
+
+def spherical_kmeans(matrix: np.ndarray, n_clusters: int, n_iterations: int = 20, sample_size: Optional[int] = 50000, seed: int = 0) -> np.ndarray:
+    """
+    Clusters unit-length row vectors by cosine similarity and returns the unit-length
+    centroids. Training runs on a random sample of at most sample_size rows.
+    """
+    rng = np.random.default_rng(seed)
+    if sample_size and matrix.shape[0] > sample_size:
+        matrix = matrix[rng.choice(matrix.shape[0], sample_size, replace=False)]
+
+    centroids = matrix[rng.choice(matrix.shape[0], n_clusters, replace=False)].copy()
+    for _ in range(n_iterations):
+        assignments = np.argmax(matrix @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, matrix)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Reseed empty clusters from random vectors so every list is used
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = matrix[rng.choice(matrix.shape[0], int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted file index over unit-length vectors. Vectors are stored grouped by cluster in
+    one contiguous matrix, with offsets marking where each cluster's list starts, and ids
+    mapping each stored row back to its row in the original matrix.
+    """
+    def __init__(self, centroids: np.ndarray, vectors: np.ndarray, ids: np.ndarray, offsets: np.ndarray, n_probe: int = 8):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+        self.n_probe = n_probe
+
+    @classmethod
+    def build(cls, embeddings, n_lists: Optional[int] = None, n_probe: int = 8, n_iterations: int = 20, seed: int = 0) -> "IVFIndex":
+        matrix = normalize_rows(embeddings)
+        n_lists = n_lists or get_default_n_lists(matrix.shape[0])
+        centroids = spherical_kmeans(matrix, n_lists, n_iterations=n_iterations, seed=seed)
+
+        assignments = np.argmax(matrix @ centroids.T, axis=1)
+        ids = np.argsort(assignments, kind="stable").astype(np.int64)
+        counts = np.bincount(assignments, minlength=n_lists)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(centroids, np.ascontiguousarray(matrix[ids]), ids, offsets, n_probe)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.centroids.nbytes + self.vectors.nbytes + self.ids.nbytes + self.offsets.nbytes
+
+    def search(self, query_embedding, top_n: int = 100, mask: Optional[np.ndarray] = None, n_probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Returns the ids and cosine similarities of the approximate top_n vectors, sorted from
+        most to least similar, and a dictionary of phase timings in seconds. Same contract
+        as VectorSearchEngine.search. A mask is applied within the probed lists, so a very
+        selective filter may need a higher n_probe to return top_n results.
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        query = normalize_vector(query_embedding)
+
+        start_probe_time = time.perf_counter()
+        lists = select_top_k(self.centroids @ query, n_probe)
+        end_probe_time = time.perf_counter()
+
+        candidate_ids = []
+        candidate_scores = []
+        for list_number in lists:
+            start, end = self.offsets[list_number], self.offsets[list_number + 1]
+            if start == end:
+                continue
+            if mask is None:
+                candidate_scores.append(self.vectors[start:end] @ query)
+                candidate_ids.append(self.ids[start:end])
+            else:
+                keep = np.flatnonzero(mask[self.ids[start:end]]) + start
+                candidate_scores.append(self.vectors[keep] @ query)
+                candidate_ids.append(self.ids[keep])
+        scores = np.concatenate(candidate_scores) if candidate_scores else np.zeros(0, dtype=np.float32)
+        ids = np.concatenate(candidate_ids) if candidate_ids else np.zeros(0, dtype=np.int64)
+        end_scoring_time = time.perf_counter()
+
+        selected = select_top_k(scores, top_n)
+        end_selection_time = time.perf_counter()
+
+        timings = {
+            "probing": end_probe_time - start_probe_time,
+            "scoring": end_scoring_time - end_probe_time,
+            "selection": end_selection_time - end_scoring_time,
+        }
+        return ids[selected], scores[selected], timings
+
+    def save(self, path: str):
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(f, centroids=self.centroids, vectors=self.vectors, ids=self.ids, offsets=self.offsets, n_probe=self.n_probe)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["vectors"], data["ids"], data["offsets"], int(data["n_probe"]))
+
+
+def get_ivf_index_path(filename: str) -> str:
+    return f"{get_store_base_path(filename)}.ivf.npz"
+
+
+def load_or_build_ivf_index(filename: str, embeddings, n_lists: Optional[int] = None, n_probe: int = 8) -> IVFIndex:
+    """
+    Loads the IVF index saved next to an embedding store, or builds and saves one if it
+    is missing, older than the store, or was built from a different number of vectors.
+    """
+    path = get_ivf_index_path(filename)
+    store_path = f"{get_store_base_path(filename)}.npy"
+    if os.path.exists(path) and (not os.path.exists(store_path) or os.path.getmtime(path) >= os.path.getmtime(store_path)):
+        index = IVFIndex.load(path)
+        if len(index) == len(embeddings):
+            index.n_probe = n_probe
+            return index
+
+    index = IVFIndex.build(embeddings, n_lists=n_lists, n_probe=n_probe)
+    index.save(path)
+    return index
+
+
+def benchmark_recall(embeddings, n_queries: int = 100, top_n: int = 10, n_probes: Tuple[int, ...] = (1, 2, 4, 8, 16, 32), n_lists: Optional[int] = None, noise: float = 0.02, seed: int = 0) -> List[dict]:
+    """
+    Measures recall@top_n and mean latency of the IVF index against exact search. Queries
+    are stored vectors with Gaussian noise added, so no embeddings API calls are needed.
+
+    Returns:
+    List[dict]: One row per n_probe with recall, mean latency and the exact search latency.
+    """
+    rng = np.random.default_rng(seed)
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    queries = matrix[rng.choice(matrix.shape[0], min(n_queries, matrix.shape[0]), replace=False)]
+    queries = queries + rng.normal(scale=noise * np.abs(queries).mean(), size=queries.shape).astype(np.float32)
+
+    exact_engine = VectorSearchEngine(matrix)
+    start_time = time.perf_counter()
+    exact_results = [set(exact_engine.search(query, top_n)[0].tolist()) for query in queries]
+    exact_latency = (time.perf_counter() - start_time) / len(queries)
+
+    start_time = time.perf_counter()
+    index = IVFIndex.build(matrix, n_lists=n_lists)
+    build_time = time.perf_counter() - start_time
+
+    rows = []
+    for n_probe in n_probes:
+        if n_probe > index.n_lists:
+            continue
+        hits = 0
+        start_time = time.perf_counter()
+        for query, exact in zip(queries, exact_results):
+            ids, _, _ = index.search(query, top_n, n_probe=n_probe)
+            hits += len(exact.intersection(ids.tolist()))
+        latency = (time.perf_counter() - start_time) / len(queries)
+        rows.append({
+            "n_lists": index.n_lists,
+            "n_probe": n_probe,
+            "recall": hits / (len(queries) * top_n),
+            "latency_ms": latency * 1000,
+            "exact_latency_ms": exact_latency * 1000,
+            "build_seconds": build_time,
+        })
+    return rows
+
+
+def print_benchmark(rows: List[dict]):
+    for row in rows:
+        print(f"n_lists {row['n_lists']:5d}  n_probe {row['n_probe']:3d}  recall {row['recall']:.3f}  "
+              f"latency {row['latency_ms']:.3f} ms  exact {row['exact_latency_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
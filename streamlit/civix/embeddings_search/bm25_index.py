@@ -0,0 +1,232 @@
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_store import get_store_base_path, get_text_hash, load_embedding_store, store_exists
+from .vector_search import format_timings, select_top_k
+
+
+# Lexical search over section text with BM25. The inverted index is stored in compressed
+# sparse row form: the postings of term t are doc_ids[offsets[t]:offsets[t + 1]] with their
+# term frequencies alongside, so the whole index is a handful of flat arrays saved in one
+# .npz file next to the embedding store. Exact-term queries need no embeddings API call.
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Only words too common in statutes to tell sections apart. Legal operators such as
+# "not", "may", "must", "shall", "any" and "all" are kept because they change meaning.
+STOPWORDS = frozenset("""
+a an and are as at be been by for from has have in into is it its of on or that the their
+there these this those to was were which with
+""".split())
+
+# A section reference like 12, 12.1, 12(3) or 12(3)(b), then words with inner apostrophes
+# or hyphens, e.g. tenant's, builders' and non-profit
+TOKEN_PATTERN = re.compile(r"\d+(?:\.\d+)*(?:\([0-9a-z.]+\))*|[a-z]+(?:['’-][a-z]+)*'?")
+
+
+def main():
+    if not store_exists("corpus_sections"):
+        print("No corpus index found, build it with corpus_index.py first")
+        return
+    index = load_or_build_bm25_index("corpus_sections", load_embedding_store("corpus_sections").texts)
+    print(f"{len(index)} sections, {index.n_terms} terms, {index.nbytes / 2**20:.1f} MiB")
+    for query in ["builders lien", "holdback", "security deposit", "section 49(2)"]:
+        indices, scores, timings = index.search(query, top_n=3)
+        print(f"{query!r}: {indices.tolist()} {np.round(scores, 2).tolist()}")
+        print(format_timings(timings))
+
+
+def stem(token: str) -> str:
+    """Light suffix stripping so plurals and possessives match: liens, lien's and liens' all become lien."""
+    token = token.replace("’", "'")
+    if token.endswith("'s"):
+        token = token[:-2]
+    token = token.rstrip("'")
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits statute text or a query into index terms. Section references are kept whole and
+    also indexed by their section number, so "12(3)" matches queries for "12(3)" and "12".
+    Hyphenated words are indexed whole and by their parts.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group()
+        if token[0].isdigit():
+            tokens.append(token)
+            if "(" in token:
+                tokens.append(token[:token.index("(")])
+            continue
+        token = stem(token)
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        tokens.append(token)
+        if "-" in token:
+            tokens.extend(stem(part) for part in token.split("-") if len(part) > 1 and part not in STOPWORDS)
+    return tokens
+
+
+def get_texts_fingerprint(texts: List[str], hashes: Optional[List[str]] = None) -> str:
+    """Returns a hash of the texts in order. Pass their hashes if already known, e.g. from get_row_hashes."""
+    fingerprint = hashlib.sha256()
+    for text_hash in hashes if hashes is not None else map(get_text_hash, texts):
+        fingerprint.update(text_hash.encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+class BM25Index:
+    """
+    Inverted index with Okapi BM25 scoring.
+
+    Parameters:
+    terms (np.ndarray): The vocabulary, with term ids as positions.
+    offsets (np.ndarray): Where each term's postings start, with one extra entry at the end.
+    doc_ids (np.ndarray): The documents containing each term, grouped by term.
+    term_freqs (np.ndarray): How often the term occurs in each of those documents.
+    doc_lengths (np.ndarray): The number of terms in each document.
+    fingerprint (str): A hash of the indexed texts, to detect when the index is stale.
+    """
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray, doc_ids: np.ndarray, term_freqs: np.ndarray, doc_lengths: np.ndarray, fingerprint: str = "", k1: float = BM25_K1, b: float = BM25_B):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.fingerprint = fingerprint
+        self.k1 = k1
+        self.b = b
+        self.term_ids = {term: term_id for term_id, term in enumerate(terms.tolist())}
+
+        n_docs = len(doc_lengths)
+        doc_freqs = np.diff(offsets)
+        self.idf = np.log(1 + (n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        average_length = doc_lengths.mean() if n_docs else 0
+        # The length normalization term of every document, computed once rather than per posting
+        self.doc_norms = (k1 * (1 - b + b * doc_lengths / average_length)).astype(np.float32) if average_length else np.full(n_docs, k1, dtype=np.float32)
+
+    @classmethod
+    def build(cls, texts: List[str], k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        postings = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc_id] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((doc_id, count))
+
+        terms = sorted(postings)
+        lengths = [len(postings[term]) for term in terms]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        doc_ids = np.zeros(offsets[-1], dtype=np.int32)
+        term_freqs = np.zeros(offsets[-1], dtype=np.uint16)
+        for term_id, term in enumerate(terms):
+            start = offsets[term_id]
+            pairs = np.array(postings[term], dtype=np.int64)
+            doc_ids[start:start + len(pairs)] = pairs[:, 0]
+            term_freqs[start:start + len(pairs)] = np.minimum(pairs[:, 1], np.iinfo(np.uint16).max)
+        return cls(np.array(terms, dtype=str), offsets, doc_ids, term_freqs, doc_lengths, get_texts_fingerprint(texts), k1, b)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @property
+    def n_terms(self) -> int:
+        return len(self.terms)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.terms, self.offsets, self.doc_ids, self.term_freqs, self.doc_lengths, self.idf, self.doc_norms))
+
+    def score(self, query: str) -> np.ndarray:
+        """Returns the BM25 score of every document for a query. Documents sharing no terms score 0."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self.term_ids.get(token)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            doc_ids = self.doc_ids[start:end]
+            term_freqs = self.term_freqs[start:end].astype(np.float32)
+            scores[doc_ids] += self.idf[term_id] * term_freqs * (self.k1 + 1) / (term_freqs + self.doc_norms[doc_ids])
+        return scores
+
+    def search(self, query: str, top_n: int = 100) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Returns the indices and BM25 scores of the top_n matching documents, sorted from
+        highest to lowest score, and a dictionary of phase timings in seconds. Documents with
+        no query terms are never returned, so fewer than top_n results may come back.
+        """
+        start_scoring_time = time.perf_counter()
+        scores = self.score(query)
+        end_scoring_time = time.perf_counter()
+
+        indices = select_top_k(scores, min(top_n, int(np.count_nonzero(scores))))
+        end_selection_time = time.perf_counter()
+
+        timings = {
+            "scoring": end_scoring_time - start_scoring_time,
+            "selection": end_selection_time - end_scoring_time,
+        }
+        return indices, scores[indices], timings
+
+    def save(self, path: str):
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez_compressed(
+                f,
+                terms=self.terms,
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                term_freqs=self.term_freqs,
+                doc_lengths=self.doc_lengths,
+                fingerprint=np.array(self.fingerprint),
+                parameters=np.array([self.k1, self.b]),
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            k1, b = data["parameters"].tolist()
+            return cls(data["terms"], data["offsets"], data["doc_ids"], data["term_freqs"], data["doc_lengths"], str(data["fingerprint"]), k1, b)
+
+
+def get_bm25_index_path(filename: str) -> str:
+    return f"{get_store_base_path(filename)}.bm25.npz"
+
+
+def load_or_build_bm25_index(filename: str, texts: List[str], hashes: Optional[List[str]] = None) -> BM25Index:
+    """
+    Loads the BM25 index saved next to an embedding store, or builds and saves one if it is
+    missing or was built from different texts. Pass the texts' hashes if they are known.
+    """
+    path = get_bm25_index_path(filename)
+    fingerprint = get_texts_fingerprint(texts, hashes)
+    if os.path.exists(path):
+        index = BM25Index.load(path)
+        if index.fingerprint == fingerprint:
+            return index
+
+    index = BM25Index.build(texts)
+    index.save(path)
+    return index
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import json
+import os
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_builder import CHARS_PER_TOKEN
+from .embedding_store import EmbeddingStore, get_row_hashes, get_store_base_path, get_text_hash
+
+
+# Splits long sections into overlapping chunks of at most chunk_tokens tokens, so a long
+# definitions section is embedded as several focused vectors rather than one diluted one.
+# Sections that fit in one chunk are embedded whole, exactly as before. Each chunk maps back
+# to its section through one int32 array, and a section scores as its best chunk. Tokens are
+# always estimated from length, never by a tokenizer that may or may not load, so the same
+# sections always chunk the same way, and a saved chunk map is reused while they are unchanged.
+
+CHUNK_TOKENS = 512
+OVERLAP_TOKENS = 64
+TOKEN_COUNTER = f"chars/{CHARS_PER_TOKEN}"  # saved with each chunk map, which is only reused if counted the same way
+WORD_PATTERN = re.compile(r"\S+\s*")
+
+
+def count_tokens(text: str) -> int:
+    """Estimates the tokens of a text from its length, erring high, so chunks stay within any model's limit."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def get_chunk_settings(chunk_tokens: int, overlap_tokens: int, store: Optional[EmbeddingStore] = None) -> dict:
+    """
+    Returns what a chunk map depends on: the token counter and chunk sizes, and, given the
+    store the chunks were embedded into, a hash of its rows, so a map is never paired with another build's store.
+    """
+    settings = {"counter": TOKEN_COUNTER, "chunk_tokens": chunk_tokens, "overlap_tokens": overlap_tokens}
+    if store is not None:
+        settings["store_hash"] = get_text_hash("".join(get_row_hashes(store)))
+    return settings
+
+
+def chunk_text(text: str, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = OVERLAP_TOKENS) -> List[str]:
+    """
+    Splits text into chunks of whole words of at most chunk_tokens tokens, each starting
+    overlap_tokens before the end of the previous one. Chunks after the first are prefixed
+    with the text's first line, the section heading, if it is short, so they keep their context.
+    """
+    if count_tokens(text) <= chunk_tokens:
+        return [text]
+
+    heading = text.split("\n", 1)[0].strip()
+    heading_tokens = count_tokens(heading) + 1
+    if heading_tokens > chunk_tokens // 4:
+        # No short first line to use as a heading, so chunks stand alone
+        heading, heading_tokens = None, 0
+    words = WORD_PATTERN.findall(text)
+    word_tokens = [count_tokens(word) for word in words]
+
+    chunks = []
+    start = 0
+    while start < len(words):
+        budget = chunk_tokens - (heading_tokens if chunks else 0)
+        end = start
+        tokens = 0
+        # Always take at least one word so a single oversized word can't stall the loop
+        while end < len(words) and (end == start or tokens + word_tokens[end] <= budget):
+            tokens += word_tokens[end]
+            end += 1
+        chunk = "".join(words[start:end]).strip()
+        chunks.append(f"{heading}\n{chunk}" if chunks and heading else chunk)
+        if end == len(words):
+            break
+
+        # Step back over overlap_tokens worth of words, always moving forward by at least one
+        overlap_start = end
+        overlap = 0
+        while overlap_start > start + 1 and overlap + word_tokens[overlap_start - 1] <= overlap_tokens:
+            overlap_start -= 1
+            overlap += word_tokens[overlap_start]
+        start = overlap_start
+    return chunks
+
+
+def chunk_sections(texts: List[str], chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = OVERLAP_TOKENS) -> Tuple[List[str], np.ndarray]:
+    """
+    Chunks every section.
+
+    Returns:
+    Tuple[List[str], np.ndarray]: The chunks in section order, and the section index of each chunk as int32.
+    """
+    chunks = []
+    chunk_sections = []
+    for section, text in enumerate(texts):
+        section_chunks = chunk_text(text, chunk_tokens, overlap_tokens)
+        chunks.extend(section_chunks)
+        chunk_sections.extend([section] * len(section_chunks))
+    return chunks, np.array(chunk_sections, dtype=np.int32)
+
+
+def max_pool_ranked(chunk_indices: np.ndarray, chunk_scores: np.ndarray, chunk_sections: np.ndarray, top_n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Turns chunk results sorted best first into the top_n sections sorted best first, each
+    scored by its best chunk. A section's first appearance in the chunk results is its best.
+    """
+    sections = chunk_sections[chunk_indices]
+    _, first = np.unique(sections, return_index=True)
+    first = np.sort(first)[:top_n]
+    return sections[first], chunk_scores[first]
+
+
+def get_chunk_candidates(top_n: int, n_chunks: int, n_sections: int) -> int:
+    """
+    Returns how many chunks to retrieve to be sure of top_n distinct sections. At most
+    n_chunks - n_sections of any set of chunks can share a section with another.
+    """
+    return min(n_chunks, top_n + n_chunks - n_sections)
+
+
+def get_chunk_map_path(filename: str) -> str:
+    return f"{get_store_base_path(filename)}.chunks.npy"
+
+
+def get_sections_path(filename: str) -> str:
+    return f"{get_store_base_path(filename)}.sections.json"
+
+
+def save_chunk_map(filename: str, chunk_sections: np.ndarray, section_texts: List[str], settings: dict):
+    """Saves the chunk to section array, and the whole section texts and chunk settings, next to the embedding store."""
+    map_path = get_chunk_map_path(filename)
+    sections_path = get_sections_path(filename)
+    with open(f"{map_path}.tmp", "wb") as f:
+        np.save(f, chunk_sections.astype(np.int32))
+    with open(f"{sections_path}.tmp", "w") as f:
+        json.dump({**settings, "sections": section_texts}, f)
+    os.replace(f"{map_path}.tmp", map_path)
+    os.replace(f"{sections_path}.tmp", sections_path)
+
+
+def load_chunk_map(filename: str, settings: Optional[dict] = None) -> Optional[Tuple[np.ndarray, List[str]]]:
+    """
+    Returns the chunk to section array and the section texts saved for a store, or None if
+    the store isn't chunked or, when settings are given, if it was chunked with other settings.
+    """
+    map_path = get_chunk_map_path(filename)
+    sections_path = get_sections_path(filename)
+    if not (os.path.exists(map_path) and os.path.exists(sections_path)):
+        return None
+    with open(sections_path) as f:
+        saved = json.load(f)
+    if settings is not None and any(saved.get(key) != value for key, value in settings.items()):
+        return None
+    return np.load(map_path), saved["sections"]
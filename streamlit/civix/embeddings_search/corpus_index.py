@@ -0,0 +1,230 @@
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..data import load_statute_dictionary
+from .embedding_store import get_current_version, get_store_base_path, load_embedding_store, save_embedding_store, store_exists
+from .chunking import get_chunk_candidates
+from .embedding_cache import get_query_embedding
+from .metadata_filter import MetadataIndex
+from .new_search import TextRanker, create_search_engine
+from .section_graph import NEIGHBOURS, SectionGraph, get_section_graph_path
+from .statute_dict import create_section_markdown, get_statute_dict_from_url
+from .vector_search import format_timings
+
+
+# A single section index over every statute in the catalog. Each vector is one section,
+# tagged with the act it belongs to and its place in the act, so one query ranks sections
+# across the whole corpus without first choosing a statute.
+
+CORPUS_INDEX_NAME = "corpus_sections"
+
+
+def main():
+    build_corpus_index()
+
+
+def get_section_records(statute_dict) -> List[dict]:
+    """
+    Returns one record per section of a statute dictionary, in statute order.
+
+    Parameters:
+    statute_dict (dict): A statute dictionary from get_statute_dict_from_url.
+
+    Returns:
+    List[dict]: Records with the section number, part, division and section markdown.
+    """
+    locations = {}
+    for part in statute_dict.get("parts", []):
+        for section_number in part["sections"]:
+            locations[section_number] = (part["part_number"], None)
+        for division in part["divisions"]:
+            for section_number in division["sections"]:
+                locations[section_number] = (part["part_number"], division["division_number"])
+
+    records = []
+    for section_number, section_html in statute_dict["sections"].items():
+        part, division = locations.get(section_number, (None, None))
+        records.append({
+            "section": section_number,
+            "part": part,
+            "division": division,
+            "text": create_section_markdown(section_html),
+        })
+    return records
+
+
+def get_statute_embedding_filename(statute_dict) -> str:
+    return f"{statute_dict['title']}, {statute_dict['neutral_citation']}.csv"
+
+
+def build_corpus_index(statutes: Optional[List[dict]] = None, include_repealed: bool = False, name: str = CORPUS_INDEX_NAME):
+    """
+    Builds the corpus-wide section index from the statute catalog and saves it as an
+    embedding store, with one row per section, or per chunk of a long section.
+    Per-statute embeddings that already exist are reused, so only statutes that have
+    never been indexed are sent to the embeddings API.
+
+    Parameters:
+    statutes (Optional[List[dict]]): Catalog records to index. Defaults to the whole catalog.
+    include_repealed (bool): Whether to index repealed statutes. Default is False.
+    name (str): The name of the store to save the index to.
+
+    Returns:
+    EmbeddingStore: The saved corpus index.
+    """
+    if statutes is None:
+        statutes = load_statute_dictionary()
+    if not include_repealed:
+        statutes = [statute for statute in statutes if not statute["repealed"]]
+
+    texts = []
+    metadata = []
+    matrices = []
+
+    for number, statute in enumerate(statutes):
+        print(f"{number + 1}/{len(statutes)} {statute['name']}, {statute['citation']}")
+        try:
+            statute_dict = get_statute_dict_from_url(statute["url"])
+            records = get_section_records(statute_dict)
+            text_ranker = TextRanker(get_statute_embedding_filename(statute_dict), [record["text"] for record in records])
+        except Exception as e:
+            print(f"Skipping {statute['name']}: {e}")
+            continue
+
+        # One row per stored vector, so a long section split into chunks contributes every chunk
+        for row, section_index in enumerate(text_ranker.chunk_sections):
+            record = records[section_index]
+            texts.append(text_ranker.store.texts[row])
+            metadata.append({
+                "act_id": statute["act_id"],
+                "name": statute["name"],
+                "citation": statute["citation"],
+                "repealed": statute["repealed"],
+                "part": record["part"],
+                "division": record["division"],
+                "section": record["section"],
+            })
+        if len(text_ranker.store):
+            matrices.append(np.asarray(text_ranker.store.embeddings, dtype=np.float32))
+
+    embeddings = np.vstack(matrices) if matrices else []
+    store = save_embedding_store(name, texts, embeddings, metadata)
+    print(f"Saved corpus index {name}: {len(store)} sections from {len({m['act_id'] for m in metadata})} statutes")
+    return store
+
+
+class CorpusIndex:
+    """
+    Searches sections across every statute in a corpus index in one pass. Use
+    index_type="ivf" for approximate search once the corpus is too large to score exactly,
+    or "float16" / "int8" to hold it in a half or a quarter of the memory. "sharded" scores
+    it exactly across the worker processes of sharded_search.py, one range of acts per shard.
+    """
+    def __init__(self, name: str = CORPUS_INDEX_NAME, index_type: str = "exact", n_probe: int = 8, rerank: bool = True):
+        # Resolved once, so the index reads only files of the version it was loaded from
+        self.index_version = get_current_version()
+        self.name = get_store_base_path(name)
+        self.store = load_embedding_store(self.name)
+        self.n_sections = None
+        self.section_graph = None
+        self.section_rows = None
+        self.metadata_index = MetadataIndex(self.store.metadata)
+        # Sharded search keeps each act's sections within one shard
+        self.search_engine = create_search_engine(self.name, self.store.embeddings, index_type, n_probe, rerank, groups=self.metadata_index.codes["act_id"])
+
+    def __len__(self):
+        return len(self.store)
+
+    def get_chunk_candidates(self, top_n: int) -> int:
+        if self.n_sections is None:
+            self.n_sections = len({(row["act_id"], row["section"]) for row in self.store.metadata})
+        return get_chunk_candidates(top_n, len(self.store), self.n_sections)
+
+    def search(self, query: str, top_n: int = 10, filters: Optional[Dict] = None, print_time: bool = False, return_timings: bool = False) -> List[Dict]:
+        """
+        Returns the top_n sections most related to the query across all statutes, as
+        dictionaries of the section metadata plus its "text" and "relatedness". filters
+        restricts the search to matching sections, e.g. {"repealed": False, "series": "SBC"};
+        see MetadataIndex for the fields.
+        """
+        start_embedding_time = time.perf_counter()
+        query_embedding = get_query_embedding(query, self.store.model)
+        end_embedding_time = time.perf_counter()
+
+        mask = self.metadata_index.get_mask(filters)
+        indices, scores, search_timings = self.search_engine.search(query_embedding, top_n=self.get_chunk_candidates(top_n), mask=mask)
+        # Keep the best chunk of each section; its text is the passage that matched
+        results = []
+        seen = set()
+        for i, score in zip(indices, scores):
+            key = (self.store.metadata[i]["act_id"], self.store.metadata[i]["section"])
+            if key in seen:
+                continue
+            seen.add(key)
+            results.append({**self.store.metadata[i], "text": self.store.texts[i], "relatedness": float(score)})
+            if len(results) == top_n:
+                break
+
+        timings = {"embedding": end_embedding_time - start_embedding_time, **search_timings}
+        timings["total"] = time.perf_counter() - start_embedding_time
+
+        if print_time:
+            print(format_timings(timings))
+        if return_timings:
+            return results, timings
+        return results
+
+
+    def get_related_sections(self, citation: str, section: str, top_n: int = NEIGHBOURS) -> List[Dict]:
+        """
+        Returns up to top_n sections of other statutes most similar to a section, as
+        dictionaries like those of search, from the corpus section graph. Returns an empty
+        list if the graph has not been built (see section_graph.main).
+        """
+        if self.section_graph is None:
+            path = get_section_graph_path(self.name)
+            if not os.path.exists(path):
+                return []
+            self.section_graph = SectionGraph.load(path)
+            # The vectors of each section, one per chunk
+            self.section_rows = {}
+            for i, row in enumerate(self.store.metadata):
+                self.section_rows.setdefault((row["citation"], row["section"]), []).append(i)
+
+        related = {}
+        for row in self.section_rows.get((citation, section), []):
+            for neighbour, score in zip(*self.section_graph.get_neighbours(row)):
+                key = (self.store.metadata[neighbour]["act_id"], self.store.metadata[neighbour]["section"])
+                if key not in related or score > related[key]["relatedness"]:
+                    related[key] = {**self.store.metadata[neighbour], "text": self.store.texts[neighbour], "relatedness": float(score)}
+        return sorted(related.values(), key=lambda result: result["relatedness"], reverse=True)[:top_n]
+
+
+_corpus_index = None
+
+
+def get_corpus_index() -> Optional[CorpusIndex]:
+    """
+    Returns the process-wide corpus index, loading it on first use and again when a new index
+    version is published. Returns None if it has not been built.
+    """
+    global _corpus_index
+    if _corpus_index is None or _corpus_index.index_version != get_current_version():
+        if not store_exists(CORPUS_INDEX_NAME):
+            return None
+        _corpus_index = CorpusIndex()
+    return _corpus_index
+
+
+def test_corpus_search():
+    corpus_index = get_corpus_index()
+    results = corpus_index.search("How long do I have to sue for unpaid work?", print_time=True)
+    for result in results:
+        print(f"{result['relatedness']:.3f} s. {result['section']} {result['name']}, {result['citation']}")
+
+
+if __name__ == "__main__":
+    main()
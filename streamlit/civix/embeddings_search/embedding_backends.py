@@ -0,0 +1,95 @@
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List
+
+import numpy as np
+import openai
+
+from .vector_search import normalize_rows
+
+
+# Embedding providers. The model name recorded in a store identifies the backend that
+# produced it, so queries against a store are always embedded by the same backend:
+#   "text-embedding-ada-002" (or any other OpenAI model) - the OpenAI embeddings API
+#   "local-hashing-{dim}" - a deterministic, offline hashed n-gram projection
+# Set EMBEDDING_MODEL in the environment to change the model used for new embeddings,
+# e.g. EMBEDDING_MODEL=local-hashing-1536 to build and search indexes without network access.
+
+DEFAULT_EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-ada-002")
+HASHING_MODEL_PREFIX = "local-hashing-"
+
+
+class EmbeddingBackend:
+    """
+    Interface for embedding providers. token_limited backends have per-input and per-request
+    token limits and a rate limit, so the builder counts tokens and throttles requests for them.
+    """
+    model = None
+    token_limited = False
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Returns the embeddings of texts as a float32 matrix, one row per text, in order."""
+        raise NotImplementedError
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    token_limited = True
+
+    def __init__(self, model: str = "text-embedding-ada-002"):
+        self.model = model
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        response = openai.Embedding.create(model=self.model, input=texts)
+        data = sorted(response["data"], key=lambda e: e["index"])
+        assert len(data) == len(texts)  # double check every input was embedded
+        return np.array([e["embedding"] for e in data], dtype=np.float32)
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic local embeddings. Word unigrams, word bigrams and character n-grams of each
+    word are hashed with CRC32 into dim signed buckets, weighted by 1 + log(count), and the
+    result normalized to unit length. Texts sharing vocabulary score high on cosine similarity,
+    which is enough to build, search and benchmark indexes without the OpenAI API.
+    """
+    token_limited = False
+
+    def __init__(self, dim: int = 1536, char_ngram_sizes=(3, 4, 5)):
+        self.dim = dim
+        self.char_ngram_sizes = char_ngram_sizes
+        self.model = f"{HASHING_MODEL_PREFIX}{dim}"
+
+    def get_features(self, text: str) -> Dict[str, int]:
+        words = re.findall(r"\w+", text.casefold())
+        features = Counter(f"w:{word}" for word in words)
+        features.update(f"b:{first} {second}" for first, second in zip(words, words[1:]))
+        for word in words:
+            padded = f"<{word}>"
+            for size in self.char_ngram_sizes:
+                features.update(f"c:{padded[i:i + size]}" for i in range(max(len(padded) - size + 1, 1)))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self.get_features(text).items():
+                feature_hash = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if feature_hash & 0x80000000 else -1.0
+                matrix[row, (feature_hash & 0x7FFFFFFF) % self.dim] += sign * (1 + math.log(count))
+        return normalize_rows(matrix)
+
+
+_backends = {}
+
+
+def get_embedding_backend(model: str = DEFAULT_EMBEDDING_MODEL) -> EmbeddingBackend:
+    """Returns the backend that produces embeddings for a model name, reusing one instance per model."""
+    if model not in _backends:
+        if model.startswith(HASHING_MODEL_PREFIX):
+            _backends[model] = HashingEmbeddingBackend(dim=int(model[len(HASHING_MODEL_PREFIX):]))
+        else:
+            _backends[model] = OpenAIEmbeddingBackend(model)
+    return _backends[model]
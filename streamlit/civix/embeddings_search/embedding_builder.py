@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
+
+import numpy as np
+import tiktoken  # for counting tokens
+from tenacity import retry, wait_random_exponential, stop_after_attempt
+
+from .embedding_backends import DEFAULT_EMBEDDING_MODEL, get_embedding_backend
+from .embedding_store import EMBEDDINGS_DIR, get_text_hash
+
+
+# Builds embeddings for large lists of strings with any embedding backend. Inputs are packed into as few requests as
+# the API's per-request input and token limits allow, several requests run at once under a
+# requests-per-minute and tokens-per-minute limiter, and every finished batch is written
+# to a checkpoint directory so an interrupted build resumes where it stopped.
+
+EMBEDDING_MODEL = DEFAULT_EMBEDDING_MODEL
+MAX_INPUTS_PER_REQUEST = 2048  # the API accepts up to 2048 inputs per request
+MAX_TOKENS_PER_INPUT = 8191  # the ada-002 context length
+MAX_TOKENS_PER_REQUEST = 100000  # conservative total across all inputs in one request
+CHARS_PER_TOKEN = 3  # conservative estimate when no tokenizer is available
+CHECKPOINTS_DIR = os.path.join(EMBEDDINGS_DIR, "checkpoints")
+# Used for retry
+ATTEMPTS = 5
+
+
+_encodings = {}
+
+
+def get_encoding(embedding_model: str):
+    """Returns the tokenizer for a model, or None if it is unknown or can't be downloaded. Cached per model."""
+    if embedding_model not in _encodings:
+        try:
+            _encodings[embedding_model] = tiktoken.encoding_for_model(embedding_model)
+        except Exception as e:
+            # Unknown model, or the tokenizer can't be downloaded, so callers estimate from length
+            print(f"No tokenizer for {embedding_model}, estimating token counts: {e}")
+            _encodings[embedding_model] = None
+    return _encodings[embedding_model]
+
+
+class RateLimiter:
+    """
+    Blocks until a request of a given token count fits within requests-per-minute and
+    tokens-per-minute budgets. Both budgets refill continuously. Safe to share between threads.
+    """
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = requests_per_minute
+        self.available_tokens = tokens_per_minute
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed_minutes = (now - self.last_refill) / 60
+        self.last_refill = now
+        self.available_requests = min(self.requests_per_minute, self.available_requests + elapsed_minutes * self.requests_per_minute)
+        self.available_tokens = min(self.tokens_per_minute, self.available_tokens + elapsed_minutes * self.tokens_per_minute)
+
+    def acquire(self, tokens: int):
+        # A request larger than the whole budget waits for a full bucket rather than forever
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.available_requests >= 1 and self.available_tokens >= tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= tokens
+                    return
+                wait_minutes = max(
+                    (1 - self.available_requests) / self.requests_per_minute,
+                    (tokens - self.available_tokens) / self.tokens_per_minute,
+                )
+            time.sleep(max(wait_minutes * 60, 0.01))
+
+
+def pack_batches(token_counts: List[int], max_inputs: int = MAX_INPUTS_PER_REQUEST, max_tokens: int = MAX_TOKENS_PER_REQUEST) -> List[List[int]]:
+    """Greedily packs input indices, in order, into batches within the per-request input and token limits."""
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for i, token_count in enumerate(token_counts):
+        if batch and (len(batch) >= max_inputs or batch_tokens + token_count > max_tokens):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(i)
+        batch_tokens += token_count
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class EmbeddingBuilder:
+    """
+    Embeds a list of strings with concurrent, rate limited, token-packed requests.
+
+    Parameters:
+    embedding_model (str): The embedding model to use.
+    max_workers (int): The number of requests in flight at once.
+    requests_per_minute (float): The request rate limit.
+    tokens_per_minute (float): The token rate limit.
+    max_inputs_per_request (int): The most inputs packed into one request.
+    max_tokens_per_request (int): The most tokens packed into one request.
+    checkpoints_dir (str): Where partial builds are kept until they finish.
+    """
+    def __init__(
+        self,
+        embedding_model: str = EMBEDDING_MODEL,
+        max_workers: int = 4,
+        requests_per_minute: float = 3000,
+        tokens_per_minute: float = 1000000,
+        max_inputs_per_request: int = MAX_INPUTS_PER_REQUEST,
+        max_tokens_per_request: int = MAX_TOKENS_PER_REQUEST,
+        checkpoints_dir: str = CHECKPOINTS_DIR,
+    ):
+        self.embedding_model = embedding_model
+        self.backend = get_embedding_backend(embedding_model)
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_inputs_per_request = max_inputs_per_request
+        self.max_tokens_per_request = max_tokens_per_request
+        self.checkpoints_dir = checkpoints_dir
+        self.encoding = get_encoding(embedding_model) if self.backend.token_limited else None
+
+    def prepare_inputs(self, string_list: List[str]):
+        """Returns the inputs truncated to the model's input limit, and their token counts."""
+        inputs = []
+        token_counts = []
+        for string in string_list:
+            if self.encoding is None:
+                token_count = len(string) // CHARS_PER_TOKEN + 1
+                if self.backend.token_limited and token_count > MAX_TOKENS_PER_INPUT:
+                    print(f"Truncating input of about {token_count} tokens to {MAX_TOKENS_PER_INPUT}")
+                    string = string[:MAX_TOKENS_PER_INPUT * CHARS_PER_TOKEN]
+                    token_count = MAX_TOKENS_PER_INPUT
+            else:
+                tokens = self.encoding.encode(string)
+                token_count = len(tokens)
+                if token_count > MAX_TOKENS_PER_INPUT:
+                    print(f"Truncating input of {token_count} tokens to {MAX_TOKENS_PER_INPUT}")
+                    string = self.encoding.decode(tokens[:MAX_TOKENS_PER_INPUT])
+                    token_count = MAX_TOKENS_PER_INPUT
+            # Empty strings are rejected by the API
+            inputs.append(string or " ")
+            token_counts.append(max(token_count, 1))
+        return inputs, token_counts
+
+    def get_checkpoint_dir(self, checkpoint_name: str, string_list: List[str]) -> str:
+        # The fingerprint ties a checkpoint to the exact inputs and model it was started with
+        fingerprint = hashlib.sha256(self.embedding_model.encode("utf-8"))
+        for string in string_list:
+            fingerprint.update(get_text_hash(string).encode("utf-8"))
+        safe_name = "".join(c if c.isalnum() or c in " ,-_" else "_" for c in os.path.basename(checkpoint_name))
+        return os.path.join(self.checkpoints_dir, f"{safe_name}-{fingerprint.hexdigest()[:16]}")
+
+    @retry(wait=wait_random_exponential(min=1, max=30), stop=stop_after_attempt(ATTEMPTS))
+    def request_embeddings(self, batch: List[str], tokens: int) -> np.ndarray:
+        if self.backend.token_limited:
+            self.rate_limiter.acquire(tokens)
+        return self.backend.embed(batch)
+
+    def build(self, string_list: List[str], checkpoint_name: Optional[str] = None) -> np.ndarray:
+        """
+        Returns the embeddings of string_list as a float32 matrix in input order. With a
+        checkpoint_name, finished batches are saved as they complete and reused if the same
+        build is run again after an interruption; the checkpoint is removed once it finishes.
+        """
+        if not string_list:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        inputs, token_counts = self.prepare_inputs(string_list)
+        batches = pack_batches(token_counts, self.max_inputs_per_request, self.max_tokens_per_request)
+
+        checkpoint_dir = None
+        if checkpoint_name:
+            checkpoint_dir = self.get_checkpoint_dir(checkpoint_name, string_list)
+            batches_path = os.path.join(checkpoint_dir, "batches.json")
+            # Saved batches are only reusable with the same packing, which depends on the
+            # request limits and whether a tokenizer was available
+            if os.path.exists(batches_path):
+                try:
+                    with open(batches_path, "r") as f:
+                        checkpoint_batches = json.load(f)
+                except ValueError:
+                    checkpoint_batches = None
+                if checkpoint_batches != batches:
+                    print(f"Discarding checkpoint {checkpoint_dir}, as its inputs were packed differently")
+                    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+            if not os.path.exists(batches_path):
+                os.makedirs(checkpoint_dir, exist_ok=True)
+                with open(f"{batches_path}.tmp", "w") as f:
+                    json.dump(batches, f)
+                os.replace(f"{batches_path}.tmp", batches_path)
+
+        results = {}
+        pending = []
+        for number, batch in enumerate(batches):
+            batch_path = os.path.join(checkpoint_dir, f"{number}.npy") if checkpoint_dir else None
+            if batch_path and os.path.exists(batch_path):
+                results[number] = np.load(batch_path)
+            else:
+                pending.append(number)
+
+        print(f"Embedding {len(string_list)} inputs in {len(batches)} requests ({len(batches) - len(pending)} from checkpoint)")
+
+        def embed_batch(number):
+            batch = batches[number]
+            embeddings = self.request_embeddings([inputs[i] for i in batch], sum(token_counts[i] for i in batch))
+            # Saved from the worker so finished batches survive a failure elsewhere in the build
+            if checkpoint_dir:
+                batch_path = os.path.join(checkpoint_dir, f"{number}.npy")
+                with open(f"{batch_path}.tmp", "wb") as f:
+                    np.save(f, embeddings)
+                os.replace(f"{batch_path}.tmp", batch_path)
+            return embeddings
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(embed_batch, number): number for number in pending}
+            for completed, future in enumerate(as_completed(futures)):
+                number = futures[future]
+                results[number] = future.result()
+                print(f"Request {completed + 1}/{len(pending)} done: {len(batches[number])} inputs")
+
+        dim = results[0].shape[1]
+        embeddings = np.zeros((len(string_list), dim), dtype=np.float32)
+        for number, batch in enumerate(batches):
+            embeddings[batch] = results[number]
+
+        if checkpoint_dir:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        return embeddings
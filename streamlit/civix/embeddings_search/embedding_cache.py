@@ -0,0 +1,152 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .embedding_backends import DEFAULT_EMBEDDING_MODEL, get_embedding_backend
+from .embedding_store import EMBEDDINGS_DIR
+
+
+# Two-tier cache for query embeddings: an in-memory LRU in front of a SQLite table on disk.
+# Keys are a hash of the embedding model and the normalized query text, so the same question
+# asked again in this session, another session, or after a restart is not re-embedded.
+
+EMBEDDING_MODEL = DEFAULT_EMBEDDING_MODEL
+CACHE_PATH = os.path.join(EMBEDDINGS_DIR, "query_embedding_cache.sqlite3")
+MAX_MEMORY_ENTRIES = 2048
+
+
+def normalize_query(text: str) -> str:
+    """Normalizes unicode, case and whitespace so trivially different queries share a cache entry."""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def get_cache_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\n{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    LRU memory cache backed by a SQLite store. Safe to share between threads.
+    Set path to None for a memory-only cache.
+    """
+    def __init__(self, path: Optional[str] = CACHE_PATH, max_memory_entries: int = MAX_MEMORY_ENTRIES):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self.connection = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, embedding BLOB)")
+            self.connection.commit()
+
+    def get(self, text: str, model: str = EMBEDDING_MODEL) -> Optional[np.ndarray]:
+        key = get_cache_key(text, model)
+        with self.lock:
+            embedding = self.memory.get(key)
+            if embedding is not None:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return embedding
+
+            if self.connection is not None:
+                row = self.connection.execute("SELECT embedding FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    embedding = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, embedding)
+                    self.stats["disk_hits"] += 1
+                    return embedding
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, text: str, model: str, embedding):
+        key = get_cache_key(text, model)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self.lock:
+            self._remember(key, embedding)
+            if self.connection is not None:
+                self.connection.execute("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", (key, model, embedding.tobytes()))
+                self.connection.commit()
+
+    def get_or_compute(self, text: str, model: str, compute_fn: Callable[[str], list]) -> np.ndarray:
+        """Returns the cached embedding of text, calling compute_fn(text) and caching the result on a miss."""
+        embedding = self.get(text, model)
+        if embedding is None:
+            embedding = np.asarray(compute_fn(text), dtype=np.float32)
+            self.put(text, model, embedding)
+        return embedding
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        self.memory[key] = embedding
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, float]:
+        """Returns hit and miss counts. Every hit is one embeddings API request saved."""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self.memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear_memory(self):
+        with self.lock:
+            self.memory.clear()
+
+
+_default_cache = None
+
+
+def get_default_embedding_cache() -> EmbeddingCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+    return _default_cache
+
+
+def request_query_embedding(query: str, embedding_model: str = EMBEDDING_MODEL) -> np.ndarray:
+    return get_embedding_backend(embedding_model).embed([query])[0]
+
+
+def get_query_embeddings(queries: List[str], embedding_model: str = EMBEDDING_MODEL, cache: Optional[EmbeddingCache] = None) -> np.ndarray:
+    """
+    Returns the embeddings of several queries as a matrix, one row per query. Queries not
+    already cached are embedded together in one request, each distinct query once.
+    """
+    cache = cache or get_default_embedding_cache()
+    embeddings = [cache.get(query, embedding_model) for query in queries]
+
+    missing = {}
+    for i, embedding in enumerate(embeddings):
+        if embedding is None:
+            missing.setdefault(normalize_query(queries[i]), []).append(i)
+    if missing:
+        texts = [queries[positions[0]] for positions in missing.values()]
+        for text, positions, embedding in zip(texts, missing.values(), get_embedding_backend(embedding_model).embed(texts)):
+            cache.put(text, embedding_model, embedding)
+            for i in positions:
+                embeddings[i] = np.asarray(embedding, dtype=np.float32)
+
+    if not embeddings:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack(embeddings)
+
+
+def get_query_embedding(query: str, embedding_model: str = EMBEDDING_MODEL, cache: Optional[EmbeddingCache] = None) -> np.ndarray:
+    """Returns the embedding of a query, from the cache if it has been embedded before with this model."""
+    cache = cache or get_default_embedding_cache()
+    return cache.get_or_compute(query, embedding_model, lambda text: request_query_embedding(text, embedding_model))
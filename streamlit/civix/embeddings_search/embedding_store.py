@@ -0,0 +1,224 @@
+import ast
+import hashlib
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# An embedding store is a pair of files sharing a base name in the data directory:
+#   {name}.npy  - float32 matrix with one row per text, opened as a memory map
+#   {name}.json - sidecar with the texts, per-row metadata and the embedding model
+# Every row's metadata records a hash of its text, so a rebuild can tell which rows changed.
+# This replaces the old CSV format, which stored every embedding as a string that had
+# to be parsed back with ast.literal_eval on each load.
+#
+# Store names resolve against the current index version: data/versions/{version}/, where
+# data/CURRENT names the version, or data/ itself if nothing has been published (see
+# index_versions.py). Set EMBEDDINGS_INDEX_VERSION to read and write another version.
+
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+STORE_EXTENSIONS = (".csv", ".npy", ".json")
+VERSIONS_DIRNAME = "versions"
+CURRENT_FILENAME = "CURRENT"
+INDEX_VERSION_ENV = "EMBEDDINGS_INDEX_VERSION"
+
+_current_version = (None, None)  # (signature of the CURRENT file, version it names)
+
+
+def main():
+    convert_all_csvs()
+
+
+class EmbeddingStore:
+    """Texts, their embeddings as a float32 matrix, and per-row metadata."""
+    def __init__(self, texts: List[str], embeddings: np.ndarray, metadata: Optional[List[dict]] = None, model: str = EMBEDDING_MODEL):
+        self.texts = texts
+        self.embeddings = embeddings
+        self.metadata = metadata if metadata is not None else [{} for _ in texts]
+        self.model = model
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def dim(self) -> int:
+        return self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Returns the store in the old text/embedding DataFrame layout. Rows are views on the matrix, not copies."""
+        df = pd.DataFrame({"text": self.texts, "embedding": list(self.embeddings)})
+        df.attrs["model"] = self.model
+        return df
+
+
+def get_current_version() -> Optional[str]:
+    """
+    Returns the index version in use: EMBEDDINGS_INDEX_VERSION if set, otherwise the version
+    named in data/CURRENT, or None if no version has been published. The CURRENT file is
+    only re-read when it is replaced, so this is cheap enough to call on every query.
+    """
+    global _current_version
+    version = os.environ.get(INDEX_VERSION_ENV)
+    if version:
+        return version
+    current_path = os.path.join(EMBEDDINGS_DIR, CURRENT_FILENAME)
+    try:
+        stat = os.stat(current_path)
+    except FileNotFoundError:
+        return None
+    signature = (current_path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _current_version[0] != signature:
+        with open(current_path, "r") as f:
+            _current_version = (signature, f.read().strip() or None)
+    return _current_version[1]
+
+
+def get_index_dir(version: Optional[str] = None) -> str:
+    """Returns the directory of an index version, by default the current one."""
+    version = version or get_current_version()
+    if version is None:
+        return EMBEDDINGS_DIR
+    return os.path.join(EMBEDDINGS_DIR, VERSIONS_DIRNAME, version)
+
+
+def get_store_base_path(filename: str) -> str:
+    """
+    Returns the path of a store without extension. Accepts a bare name, an old-style
+    "{name}.csv" filename, or an absolute path. Bare names resolve in the current index version.
+    """
+    base, extension = os.path.splitext(filename)
+    if extension not in STORE_EXTENSIONS:
+        base = filename
+    if not os.path.isabs(base):
+        base = os.path.join(get_index_dir(), base)
+    return base
+
+
+def get_text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def store_exists(filename: str) -> bool:
+    base = get_store_base_path(filename)
+    return os.path.exists(f"{base}.npy") and os.path.exists(f"{base}.json")
+
+
+def save_embedding_store(filename: str, texts: List[str], embeddings, metadata: Optional[List[dict]] = None, model: str = EMBEDDING_MODEL) -> EmbeddingStore:
+    """
+    Saves texts and embeddings as a binary store. Each file is written to a temporary
+    path first and then moved into place, so a reader never sees a half-written store.
+
+    Parameters:
+    filename (str): The store name, old-style CSV filename, or absolute path.
+    texts (List[str]): The embedded texts, in row order.
+    embeddings: The embeddings, as a list of lists or an array of shape (len(texts), dim).
+    metadata (Optional[List[dict]]): JSON-serializable metadata for each row. A "hash" of
+        the text is added to each row's metadata.
+    model (str): The embedding model that produced the vectors.
+
+    Returns:
+    EmbeddingStore: The saved store, memory mapped from disk.
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.size == 0:
+        matrix = matrix.reshape(0, 0)
+    if matrix.ndim != 2 or matrix.shape[0] != len(texts):
+        raise ValueError(f"Expected {len(texts)} embeddings, got array of shape {matrix.shape}")
+    if metadata is not None and len(metadata) != len(texts):
+        raise ValueError(f"Expected {len(texts)} metadata records, got {len(metadata)}")
+
+    base = get_store_base_path(filename)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+
+    if metadata is None:
+        metadata = [{} for _ in texts]
+    metadata = [{**row, "hash": get_text_hash(text)} for row, text in zip(metadata, texts)]
+
+    sidecar = {
+        "model": model,
+        "count": len(texts),
+        "dim": int(matrix.shape[1]),
+        "texts": list(texts),
+        "metadata": metadata,
+    }
+
+    with open(f"{base}.npy.tmp", "wb") as f:
+        np.save(f, matrix)
+    with open(f"{base}.json.tmp", "w") as f:
+        json.dump(sidecar, f)
+    os.replace(f"{base}.npy.tmp", f"{base}.npy")
+    os.replace(f"{base}.json.tmp", f"{base}.json")
+
+    return load_embedding_store(filename)
+
+
+def load_embedding_store(filename: str, mmap: bool = True) -> EmbeddingStore:
+    """
+    Loads a binary store. With mmap=True the matrix is memory mapped read-only, so
+    loading costs only the sidecar parse and pages are read from disk on first use.
+    """
+    base = get_store_base_path(filename)
+    if not store_exists(base):
+        raise FileNotFoundError(f"No embedding store at {base}.npy")
+
+    with open(f"{base}.json", "r") as f:
+        sidecar = json.load(f)
+
+    embeddings = np.load(f"{base}.npy", mmap_mode="r" if mmap else None)
+    if embeddings.shape[0] != sidecar["count"]:
+        raise ValueError(f"Embedding store {base} is inconsistent: {embeddings.shape[0]} vectors, {sidecar['count']} texts")
+
+    return EmbeddingStore(sidecar["texts"], embeddings, sidecar["metadata"], sidecar["model"])
+
+
+def get_row_hashes(store: EmbeddingStore) -> List[str]:
+    """Returns the text hash of every row, computing it for stores saved before hashes were recorded."""
+    return [row.get("hash") or get_text_hash(text) for row, text in zip(store.metadata, store.texts)]
+
+
+def load_or_convert_store(filename: str) -> EmbeddingStore:
+    """Loads a binary store, converting the old-style CSV of the same name first if that is all there is."""
+    if store_exists(filename):
+        return load_embedding_store(filename)
+
+    csv_path = f"{get_store_base_path(filename)}.csv"
+    if os.path.exists(csv_path):
+        return convert_csv_to_store(csv_path)
+
+    raise FileNotFoundError(f"No embedding store or CSV for {filename}")
+
+
+def convert_csv_to_store(csv_path: str, model: str = EMBEDDING_MODEL) -> EmbeddingStore:
+    """Converts an old-style text/embedding CSV into a binary store next to it. The CSV is left in place."""
+    df = pd.read_csv(csv_path)
+    embeddings = [ast.literal_eval(embedding) for embedding in df["embedding"]]
+    return save_embedding_store(csv_path, df["text"].tolist(), embeddings, model=model)
+
+
+def convert_all_csvs(data_dir: Optional[str] = None, overwrite: bool = False) -> List[str]:
+    """
+    One-shot conversion of every embeddings CSV in data_dir, by default the current index
+    version, to the binary format. Returns the list of converted filenames.
+    """
+    data_dir = data_dir or get_index_dir()
+    converted = []
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith(".csv"):
+            continue
+        csv_path = os.path.join(data_dir, filename)
+        if store_exists(csv_path) and not overwrite:
+            print(f"Skipping {filename}, store exists")
+            continue
+        store = convert_csv_to_store(csv_path)
+        print(f"Converted {filename}: {len(store)} vectors of dimension {store.dim}")
+        converted.append(filename)
+    return converted
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,9 @@
-import os
+from .embedding_backends import DEFAULT_EMBEDDING_MODEL
+from .embedding_builder import EmbeddingBuilder
+from .embedding_store import save_embedding_store
 
-import openai  # for calling the OpenAI API
-import pandas as pd  # for storing text and embeddings data
 
-
-EMBEDDING_MODEL = "text-embedding-ada-002"  # OpenAI's best embeddings as of Apr 2023
-BATCH_SIZE = 1000  # you can submit up to 2048 embedding inputs per request
+EMBEDDING_MODEL = DEFAULT_EMBEDDING_MODEL  # text-embedding-ada-002 unless set in the environment
 
 def main():
     pass
@@ -18,26 +16,10 @@ def generate_statute_name_embeddings():
 
 
 def generate_embeddings(string_list, filename):
-    embeddings = []
-    for batch_start in range(0, len(string_list), BATCH_SIZE):
-        batch_end = batch_start + BATCH_SIZE
-        batch = string_list[batch_start:batch_end]
-        print(f"Batch {batch_start} to {batch_end-1}")
-        response = openai.Embedding.create(model=EMBEDDING_MODEL, input=batch)
-        for i, be in enumerate(response["data"]):
-            assert i == be["index"]  # double check embeddings are in same order as input
-        batch_embeddings = [e["embedding"] for e in response["data"]]
-        embeddings.extend(batch_embeddings)
-    
-    df = pd.DataFrame({"text": string_list, "embedding": embeddings})
-    
-    save_path = f"data/{filename}"
-    
-    # Create the directory if it doesn't exist
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    
-    # Write DataFrame to the file
-    df.to_csv(save_path, index=False)
+    builder = EmbeddingBuilder(embedding_model=EMBEDDING_MODEL)
+    embeddings = builder.build(string_list, checkpoint_name=filename)
+
+    save_embedding_store(filename, string_list, embeddings, model=EMBEDDING_MODEL)
 
 
 
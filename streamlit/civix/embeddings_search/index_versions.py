@@ -0,0 +1,104 @@
+import os
+import shutil
+import sys
+import time
+from typing import List, Optional
+
+from . import embedding_store
+from .embedding_store import CURRENT_FILENAME, INDEX_VERSION_ENV, VERSIONS_DIRNAME, get_current_version, get_index_dir
+
+
+# Versioned index directories with atomic publish. A rebuild writes a new version directory,
+# starting from hard links to the current version's files so unchanged statutes cost nothing,
+# and is published by atomically replacing data/CURRENT. The running app checks CURRENT on
+# each query: new queries load rankers from the new version, while queries already running
+# keep the rankers, and so the files, of the version they started with. Stores are only ever
+# written to a temporary file and renamed into place, so a hard-linked file shared with an
+# older version is never modified in place.
+#
+#   python -m streamlit.civix.embeddings_search.index_versions create
+#   EMBEDDINGS_INDEX_VERSION=<version> python -m streamlit.civix.embeddings_search.corpus_index
+#   python -m streamlit.civix.embeddings_search.index_versions publish <version>
+
+KEEP_VERSIONS = 3
+# Files in the data directory that belong to no index version
+UNVERSIONED_NAMES = (VERSIONS_DIRNAME, CURRENT_FILENAME, "checkpoints", "query_embedding_cache.sqlite3")
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "create":
+        version = create_version(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"Created index version {version}. Build into it with {INDEX_VERSION_ENV}={version}, then publish it.")
+    elif command == "publish":
+        publish_version(sys.argv[2])
+        print(f"Published index version {sys.argv[2]}")
+    elif command == "prune":
+        for version in prune_versions():
+            print(f"Removed index version {version}")
+    else:
+        current = get_current_version()
+        for version in list_versions():
+            print(f"{version}{' (current)' if version == current else ''}")
+
+
+def get_versions_dir() -> str:
+    return os.path.join(embedding_store.EMBEDDINGS_DIR, VERSIONS_DIRNAME)
+
+
+def list_versions() -> List[str]:
+    """Returns every index version, oldest first."""
+    versions_dir = get_versions_dir()
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(name for name in os.listdir(versions_dir) if os.path.isdir(os.path.join(versions_dir, name)))
+
+
+def create_version(version: Optional[str] = None, base_version: Optional[str] = None) -> str:
+    """
+    Creates a new, unpublished index version holding the files of base_version, by default
+    the current version (or the unversioned data directory), as hard links. Returns its name.
+    """
+    version = version or time.strftime("%Y%m%d_%H%M%S")
+    source_dir = get_index_dir(base_version)
+    version_dir = os.path.join(get_versions_dir(), version)
+    os.makedirs(version_dir)
+
+    for filename in os.listdir(source_dir):
+        source_path = os.path.join(source_dir, filename)
+        if filename in UNVERSIONED_NAMES or filename.endswith(".tmp") or not os.path.isfile(source_path):
+            continue
+        try:
+            os.link(source_path, os.path.join(version_dir, filename))
+        except OSError:
+            shutil.copy2(source_path, os.path.join(version_dir, filename))
+    return version
+
+
+def publish_version(version: str):
+    """Atomically makes version the current index version."""
+    if not os.path.isdir(os.path.join(get_versions_dir(), version)):
+        raise ValueError(f"No index version {version} in {get_versions_dir()}")
+    current_path = os.path.join(embedding_store.EMBEDDINGS_DIR, CURRENT_FILENAME)
+    with open(f"{current_path}.tmp", "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{current_path}.tmp", current_path)
+
+
+def prune_versions(keep: int = KEEP_VERSIONS) -> List[str]:
+    """
+    Removes all but the newest keep versions, never the current one. Rankers loaded from a
+    removed version keep their memory-mapped vectors, but should not be relied on for long.
+    """
+    current = get_current_version()
+    versions = list_versions()
+    removed = [version for version in versions[:max(len(versions) - keep, 0)] if version != current]
+    for version in removed:
+        shutil.rmtree(os.path.join(get_versions_dir(), version))
+    return removed
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# Per-vector attributes for filtered search. Categorical attributes (act, part, division,
+# revision) are stored as one int32 code per vector with a table of distinct values, and
+# boolean attributes (repealed) as packed bitsets of one bit per vector. A filter turns into
+# a boolean mask with a few vectorized comparisons, which search engines apply before top-k.
+
+CATEGORICAL_FIELDS = ("act_id", "part", "division", "revision", "series")
+BOOLEAN_FIELDS = ("repealed",)
+MAX_CACHED_MASKS = 256
+
+
+def get_revision(citation: Optional[str]) -> Optional[str]:
+    """Returns the revision a citation belongs to, e.g. "RSBC 1996" for "RSBC 1996, c 1"."""
+    if not citation:
+        return None
+    match = re.match(r"([A-Z]+ \d{4})", citation)
+    return match.group(1) if match else None
+
+
+def get_vector_attributes(row: dict) -> dict:
+    """Returns the filterable attributes of one vector's metadata, deriving the revision from its citation."""
+    revision = get_revision(row.get("citation"))
+    return {
+        "act_id": row.get("act_id"),
+        "part": row.get("part"),
+        "division": row.get("division"),
+        "revision": revision,
+        "series": revision.split()[0] if revision else None,
+        "repealed": bool(row.get("repealed", False)),
+    }
+
+
+class MetadataIndex:
+    """
+    Filterable attributes of every vector in a store.
+
+    Filters are dictionaries of field to value, or to a list of accepted values, and all
+    fields must match, e.g. {"repealed": False, "series": "RSBC", "part": ["Part 2", "Part 3"]}.
+    Fields are act_id, part, division, revision (e.g. "SBC 2002"), series ("RSBC" or "SBC")
+    and repealed.
+    """
+    def __init__(self, metadata: List[dict]):
+        self.size = len(metadata)
+        attributes = [get_vector_attributes(row) for row in metadata]
+
+        self.codes = {}
+        self.values = {}
+        for field in CATEGORICAL_FIELDS:
+            value_codes = {}
+            codes = np.fromiter((value_codes.setdefault(row[field], len(value_codes)) for row in attributes), dtype=np.int32, count=self.size)
+            self.codes[field] = codes
+            self.values[field] = value_codes
+
+        self.bitsets = {
+            field: np.packbits(np.fromiter((row[field] for row in attributes), dtype=bool, count=self.size))
+            for field in BOOLEAN_FIELDS
+        }
+        # Masks of recent filters, packed to one bit per vector
+        self.mask_cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return sum(codes.nbytes for codes in self.codes.values()) + sum(bits.nbytes for bits in self.bitsets.values())
+
+    def get_field_mask(self, field: str, value) -> np.ndarray:
+        accepted = value if isinstance(value, (list, tuple, set)) else [value]
+        if field in self.bitsets:
+            bits = np.unpackbits(self.bitsets[field], count=self.size).astype(bool)
+            accepted = {bool(v) for v in accepted}
+            if accepted == {True}:
+                return bits
+            if accepted == {False}:
+                return ~bits
+            return np.ones(self.size, dtype=bool) if accepted else np.zeros(self.size, dtype=bool)
+        if field in self.codes:
+            codes = [self.values[field][v] for v in accepted if v in self.values[field]]
+            if len(codes) == 1:
+                return self.codes[field] == codes[0]
+            return np.isin(self.codes[field], codes)
+        raise ValueError(f"Unknown filter field {field}, expected one of {CATEGORICAL_FIELDS + BOOLEAN_FIELDS}")
+
+    def get_mask(self, filters: Optional[Dict] = None) -> Optional[np.ndarray]:
+        """Returns a boolean mask of the vectors matching every filter, or None if there are no filters."""
+        if not filters:
+            return None
+        # Values keyed with their type, as 2 and "2" can select different rows
+        key = frozenset(
+            (field, frozenset((type(v), v) for v in value) if isinstance(value, (list, tuple, set)) else (type(value), value))
+            for field, value in filters.items()
+        )
+        with self.lock:
+            packed = self.mask_cache.get(key)
+            if packed is not None:
+                self.mask_cache.move_to_end(key)
+        if packed is not None:
+            return np.unpackbits(packed, count=self.size).astype(bool)
+
+        mask = np.ones(self.size, dtype=bool)
+        for field, value in filters.items():
+            mask &= self.get_field_mask(field, value)
+
+        with self.lock:
+            self.mask_cache[key] = np.packbits(mask)
+            while len(self.mask_cache) > MAX_CACHED_MASKS:
+                self.mask_cache.popitem(last=False)
+        return mask
+
+    def get_values(self, field: str) -> List:
+        """Returns the distinct values of a categorical field, for building filter choices."""
+        return [value for value in self.values[field] if value is not None]
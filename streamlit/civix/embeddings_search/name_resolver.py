@@ -0,0 +1,150 @@
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from ..data import get_statute_catalog, load_statute_dictionary
+from ..trigram_index import TrigramIndex, normalize_text
+from .embedding_backends import DEFAULT_EMBEDDING_MODEL
+from .embedding_cache import get_query_embedding
+from .embedding_store import get_current_version, load_or_convert_store, store_exists
+from .new_search import generate_embeddings_and_save
+from .score_fusion import fuse_rankings
+from .vector_search import VectorSearchEngine
+
+
+# Resolves what a user typed to statute names in the catalog. Exact names (ignoring case and
+# punctuation) resolve immediately, typos and partial names through a character trigram index,
+# and descriptions that share few characters with the name, e.g. "strata" for the Strata
+# Property Act, through the statute name embeddings when the trigram match is not confident.
+
+NAME_EMBEDDINGS_NAME = "statute_name_embeddings"
+CONFIDENT_SCORE = 0.75  # trigram score above which the name embeddings aren't consulted
+CONFIDENT_MARGIN = 0.1  # how far the best name must be ahead of the next to be chosen outright
+TRIGRAM_WEIGHT = 0.5
+
+
+def main():
+    if not store_exists(NAME_EMBEDDINGS_NAME):
+        build_name_embeddings()
+    test_resolve_names()
+
+
+def get_catalog_names(include_repealed: bool = False) -> List[str]:
+    """Returns each distinct statute name in the catalog, in catalog order."""
+    names = {}
+    for statute in load_statute_dictionary():
+        if include_repealed or not statute["repealed"]:
+            names.setdefault(statute["name"], None)
+    return list(names)
+
+
+def build_name_embeddings(names: Optional[List[str]] = None, embedding_model: str = DEFAULT_EMBEDDING_MODEL):
+    """Embeds every statute name in the catalog, for get_law_names_by_relatedness and the name resolver."""
+    names = names if names is not None else get_catalog_names()
+    generate_embeddings_and_save(names, NAME_EMBEDDINGS_NAME, embedding_model)
+
+
+class NameResolver:
+    """
+    Ranks statute names against a query.
+
+    Parameters:
+    names (List[str]): The statute names to resolve to.
+    embedding_filename (str): The store of name embeddings. Resolution uses trigrams alone if it doesn't exist.
+    """
+    def __init__(self, names: List[str], embedding_filename: str = NAME_EMBEDDINGS_NAME):
+        self.names = names
+        self.name_ids = {normalize_text(name): name_id for name_id, name in enumerate(names)}
+        self.trigram_index = TrigramIndex(names)
+        self.catalog = None  # the statute catalog the names came from, set by get_name_resolver
+
+        self.search_engine = None
+        self.embedding_model = None
+        self.index_version = get_current_version()
+        if store_exists(embedding_filename):
+            store = load_or_convert_store(embedding_filename)
+            # Only rows for current catalog names, with each row's name id alongside
+            rows = [(row, self.name_ids[normalize_text(text)]) for row, text in enumerate(store.texts) if normalize_text(text) in self.name_ids]
+            if rows:
+                self.search_engine = VectorSearchEngine(store.embeddings[[row for row, _ in rows]])
+                self.embedding_name_ids = np.array([name_id for _, name_id in rows], dtype=np.int64)
+                self.embedding_model = store.model
+
+    def resolve(self, query: str, top_n: int = 5, use_embeddings: bool = True, return_timings: bool = False) -> Tuple[List[str], List[float]]:
+        """
+        Returns up to top_n statute names and scores, best first. An exact name returns only
+        itself with a score of 1. The name embeddings are only used, and the query only
+        embedded, when no name matches the query's trigrams confidently.
+        """
+        start_time = time.perf_counter()
+        timings = {}
+        name_id = self.name_ids.get(normalize_text(query))
+        if name_id is not None:
+            names, scores = [self.names[name_id]], [1.0]
+        else:
+            trigram_ids, trigram_scores = self.trigram_index.search(query, top_n=max(top_n, 20))
+            timings["trigrams"] = time.perf_counter() - start_time
+            confident = len(trigram_scores) and trigram_scores[0] >= CONFIDENT_SCORE
+
+            if confident or not use_embeddings or self.search_engine is None:
+                names = [self.names[i] for i in trigram_ids[:top_n]]
+                scores = trigram_scores[:top_n].tolist()
+            else:
+                start_embedding_time = time.perf_counter()
+                query_embedding = get_query_embedding(query, self.embedding_model)
+                rows, embedding_scores, _ = self.search_engine.search(query_embedding, top_n=max(top_n, 20))
+                timings["embedding"] = time.perf_counter() - start_embedding_time
+                ids, fused = fuse_rankings(
+                    [(trigram_ids, trigram_scores), (self.embedding_name_ids[rows], embedding_scores)],
+                    len(self.names),
+                    weights=[TRIGRAM_WEIGHT, 1 - TRIGRAM_WEIGHT],
+                    method="weighted",
+                    top_n=top_n,
+                )
+                names = [self.names[i] for i in ids]
+                scores = fused.tolist()
+
+        timings["total"] = time.perf_counter() - start_time
+        if return_timings:
+            return names, scores, timings
+        return names, scores
+
+    def resolve_one(self, query: str, use_embeddings: bool = True) -> Optional[str]:
+        """Returns the name the query clearly refers to, or None if there is no match or it is ambiguous."""
+        names, scores = self.resolve(query, top_n=2, use_embeddings=use_embeddings)
+        if not names:
+            return None
+        if scores[0] == 1.0 and normalize_text(names[0]) == normalize_text(query):
+            return names[0]
+        if scores[0] >= CONFIDENT_SCORE and (len(scores) == 1 or scores[0] - scores[1] >= CONFIDENT_MARGIN):
+            return names[0]
+        return None
+
+
+_name_resolver = None
+
+
+def get_name_resolver() -> NameResolver:
+    """
+    Returns the process-wide resolver over the names of statutes in force, building it on
+    first use and again when a new index version is published or the statute catalog is reloaded.
+    """
+    global _name_resolver
+    catalog = get_statute_catalog()
+    if _name_resolver is None or _name_resolver.index_version != get_current_version() or _name_resolver.catalog is not catalog:
+        name_resolver = NameResolver(get_catalog_names())
+        name_resolver.catalog = catalog
+        _name_resolver = name_resolver
+    return _name_resolver
+
+
+def test_resolve_names():
+    resolver = get_name_resolver()
+    for query in ["Residential Tenancy Act", "residental tenency", "builders lien", "limitation", "motor vehicle"]:
+        names, scores, timings = resolver.resolve(query, use_embeddings=False, return_timings=True)
+        print(f"{query!r} ({timings['total'] * 1000:.3f} ms): {[f'{name} {score:.2f}' for name, score in zip(names, scores)]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,112 +1,363 @@
-import ast
 import os
+import sys
 import time
 import numpy as np
-import openai
-import pandas as pd
-from scipy import spatial
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
+from .ann_index import load_or_build_ivf_index
+from .bm25_index import load_or_build_bm25_index
+from .chunking import OVERLAP_TOKENS, chunk_sections, get_chunk_candidates, get_chunk_map_path, get_chunk_settings, get_sections_path, load_chunk_map, max_pool_ranked, save_chunk_map
+from .embedding_backends import DEFAULT_EMBEDDING_MODEL
+from .embedding_builder import EmbeddingBuilder
+from .embedding_cache import get_query_embedding, get_query_embeddings
+from .embedding_store import get_current_version, get_row_hashes, get_store_base_path, get_text_hash, load_or_convert_store, save_embedding_store, store_exists
+from .quantization import QUANTIZED_DTYPES, QuantizedSearchEngine
+from .section_graph import NEIGHBOURS, load_or_build_section_graph
+from .sharded_search import ShardedSearchEngine
+from .vector_search import VectorSearchEngine, format_timings
 
-EMBEDDING_MODEL = "text-embedding-ada-002"  # OpenAI's best embeddings as of Apr 2023
+
+EMBEDDING_MODEL = DEFAULT_EMBEDDING_MODEL  # text-embedding-ada-002 unless set in the environment
 GPT_MODEL = "gpt-3.5-turbo"
 
 
+SEARCH_INDEX_TYPES = ("exact", "ivf", "float16", "int8", "sharded")
+
+
 class TextRanker:
-    def __init__(self, embedding_filename: str, strings: List[str], embedding_model: str=EMBEDDING_MODEL):
+    def __init__(self, embedding_filename: str, strings: List[str], embedding_model: str=EMBEDDING_MODEL, index_type: str="exact", n_probe: int=8, rerank: bool=True, chunk_tokens: Optional[int]=None, overlap_tokens: int=OVERLAP_TOKENS):
         self.strings = strings
         self.embedding_model = embedding_model
-        self.embedding_filename = embedding_filename
-        self.embeddings_df = self.generate_or_load_embeddings()
+        # Resolved once, so every file this ranker reads or writes is in the index version it started on
+        self.index_version = get_current_version()
+        self.embedding_filename = get_store_base_path(embedding_filename)
+        # Sections longer than chunk_tokens, e.g. chunking.CHUNK_TOKENS, are embedded as overlapping chunks; None embeds every section whole
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.section_texts = None
+        self.chunk_sections = None
+        self.sync_stats = None
+        self.bm25_index = None
+        self.section_graph = None
+        self.section_ids = None
+        self.generate_or_load_embeddings()
+        self.search_engine = create_search_engine(self.embedding_filename, self.store.embeddings, index_type, n_probe, rerank)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the ranker: its search indexes plus the stored texts."""
+        nbytes = self.search_engine.nbytes + self.chunk_sections.nbytes + sum(sys.getsizeof(text) for text in self.store.texts)
+        if self.section_texts is not self.store.texts and self.section_texts is not self.strings:
+            nbytes += sum(sys.getsizeof(text) for text in self.section_texts)
+        if self.bm25_index is not None:
+            nbytes += self.bm25_index.nbytes
+        if self.section_graph is not None:
+            nbytes += self.section_graph.nbytes
+        return nbytes
 
-    
     def generate_or_load_embeddings(self):
-        embeddings_path = f"/home/runner/StatuteSearch/streamlit/civix/embeddings_search/data/{self.embedding_filename}"
+        base_path = get_store_base_path(self.embedding_filename)
     
-        if os.path.exists(embeddings_path):
-            df = self.get_df_by_filename(embeddings_path)
+        if self.strings:
+            chunks = self.chunk_strings()
+            # Only sections that are new or changed since the last build are embedded
+            self.store, self.sync_stats = sync_embeddings(chunks, self.embedding_filename, self.embedding_model)
+            # Only once the store matches the chunks, so a failed build leaves the old map with the old store
+            self.save_chunk_map(len(chunks))
+        elif store_exists(base_path) or os.path.exists(f"{base_path}.csv"):
+            self.store = self.get_store_by_filename(self.embedding_filename)
+            chunk_map = load_chunk_map(self.embedding_filename)
+            if chunk_map is not None:
+                self.chunk_sections, self.section_texts = chunk_map
+            else:
+                self.chunk_sections, self.section_texts = np.arange(len(self.store), dtype=np.int32), self.store.texts
         else:
-            generate_embeddings_and_save(self.strings, self.embedding_filename)
-            df = self.load_embeddings(embeddings_path)
-    
-        return df
+            raise ValueError(f"No embeddings exist for {self.embedding_filename} and no strings were given to embed")
+
+    def chunk_strings(self) -> List[str]:
+        """
+        Splits long strings into chunks, records which string each chunk came from, and returns
+        the chunks. Unchanged strings keep the chunks of the saved chunk map rather than being chunked again.
+        """
+        self.section_texts = self.strings
+        if not self.chunk_tokens:
+            self.chunk_sections = np.arange(len(self.strings), dtype=np.int32)
+            return self.strings
+        chunks = self.load_saved_chunks()
+        if chunks is None:
+            chunks, self.chunk_sections = chunk_sections(self.strings, self.chunk_tokens, self.overlap_tokens)
+        return chunks
 
-    def get_df_by_filename(self, embeddings_path):
+    def load_saved_chunks(self) -> Optional[List[str]]:
+        """Returns the stored chunks if the saved chunk map was made from the same strings, settings and store, else None."""
+        try:
+            store = load_or_convert_store(self.embedding_filename)
+        except FileNotFoundError:
+            return None
+        if store.model != self.embedding_model:
+            return None
+        saved = load_chunk_map(self.embedding_filename, get_chunk_settings(self.chunk_tokens, self.overlap_tokens, store))
+        if saved is None or saved[1] != list(self.strings):
+            return None
+        self.chunk_sections = saved[0]
+        return list(store.texts)
+
+    def save_chunk_map(self, n_chunks: int):
+        """Saves the chunk map next to the store if any section was chunked, unless it is already saved, and removes it otherwise."""
+        if n_chunks > len(self.strings):
+            # Saved so the store can be searched by whole section without the strings
+            settings = get_chunk_settings(self.chunk_tokens, self.overlap_tokens, self.store)
+            saved = load_chunk_map(self.embedding_filename, settings)
+            if saved is None or not np.array_equal(saved[0], self.chunk_sections) or saved[1] != list(self.strings):
+                save_chunk_map(self.embedding_filename, self.chunk_sections, self.strings, settings)
+        else:
+            for path in (get_chunk_map_path(self.embedding_filename), get_sections_path(self.embedding_filename)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def search_sections(self, search, top_n: int):
+        """
+        Runs search(n_chunks) and max-pools the chunk results into the top_n sections.
+        Returns the section indices, their scores and the search timings.
+        """
+        n_candidates = get_chunk_candidates(top_n, len(self.chunk_sections), len(self.section_texts))
+        indices, scores, timings = search(n_candidates)
+        start_pooling_time = time.perf_counter()
+        indices, scores = max_pool_ranked(indices, scores, self.chunk_sections, top_n)
+        timings["pooling"] = time.perf_counter() - start_pooling_time
+        return indices, scores, timings
+
+    def get_store_by_filename(self, embeddings_path):
     
         try:
-            df = self.load_embeddings(embeddings_path)
-            return df
-        except Exception:
+            return self.load_embeddings(embeddings_path)
+        except FileNotFoundError:
             raise ValueError(f"Filepath {embeddings_path} does not exist")
     
     
     def load_embeddings(self, path: str):
-        data_path = "/home/runner/StatuteSearch/streamlit/civix/embeddings_search/data/"
-        path = os.path.join(data_path, path)
-        df = pd.read_csv(path)
-        df['embedding'] = df['embedding'].apply(ast.literal_eval)
-        return df
+        # Memory maps the binary store, converting a legacy CSV on first load
+        return load_or_convert_store(path)
 
     def strings_ranked_by_relatedness(
         self,
         query: str,
-        df: pd.DataFrame,
-        relatedness_fn=lambda x, y: 1 - spatial.distance.cosine(x, y),
         top_n: int = 100,
-        print_time = False
+        print_time = False,
+        return_timings = False
     ) -> tuple[list[str], list[float]]:
-        """Returns a list of strings and relatednesses, sorted from most related to least."""
-        start_embedding_time = time.time()
-        query_embedding_response = openai.Embedding.create(
-            model=EMBEDDING_MODEL,
-            input=query,
-        )
-        query_embedding = query_embedding_response["data"][0]["embedding"]
-        end_embedding_time = time.time()
-        
-        start_search_time = time.time()
-        strings_and_relatednesses = [
-            (row["text"], relatedness_fn(query_embedding, row["embedding"]))
-            for i, row in df.iterrows()
-        ]
-        strings_and_relatednesses.sort(key=lambda x: x[1], reverse=True)
-        end_search_time = time.time()
-    
+        """
+        Returns a list of strings and relatednesses, sorted from most related to least.
+        A string split into chunks scores as its most related chunk.
+        With return_timings=True also returns a dictionary of per-phase timings in seconds.
+        """
+        start_embedding_time = time.perf_counter()
+        # Queries must be embedded by the same model as the stored vectors
+        query_embedding = get_query_embedding(query, self.store.model)
+        end_embedding_time = time.perf_counter()
+
+        indices, scores, search_timings = self.search_sections(lambda n: self.search_engine.search(query_embedding, top_n=n), top_n)
+        strings = tuple(self.section_texts[i] for i in indices)
+        relatednesses = tuple(float(score) for score in scores)
+
+        timings = {"embedding": end_embedding_time - start_embedding_time, **search_timings}
+        timings["total"] = time.perf_counter() - start_embedding_time
+
         if print_time:
-            print(f"Embedding time: {end_embedding_time - start_embedding_time}\nSearch time: {end_search_time - start_search_time}")
-        strings, relatednesses = zip(*strings_and_relatednesses)
-        return strings[:top_n], relatednesses[:top_n]
+            print(format_timings(timings))
+        if return_timings:
+            return strings, relatednesses, timings
+        return strings, relatednesses
 
     
-    def execute_query(self, query: str, top_n: int = 10) -> Tuple[List[str], List[float]]:
-        strings, relatedness = self.strings_ranked_by_relatedness(
+    def execute_query(self, query: str, top_n: int = 10, return_timings: bool = False) -> Tuple[List[str], List[float]]:
+        return self.strings_ranked_by_relatedness(
             query=query,
             top_n=top_n,
-            df=self.embeddings_df
+            return_timings=return_timings
         )
 
-        return strings, relatedness
+    def execute_queries(self, queries: List[str], top_n: int = 10, return_timings: bool = False) -> List[Tuple[Tuple[str], Tuple[float]]]:
+        """
+        Ranks the strings for several queries at once. Uncached queries are embedded in one
+        request and scored with one matrix-matrix product against the stored vectors.
 
+        Returns:
+        List[Tuple[Tuple[str], Tuple[float]]]: The (strings, relatednesses) of each query, in
+        query order. With return_timings=True also returns the timings of each phase for the
+        whole batch, plus "per_query", the mean total time per query.
+        """
+        start_embedding_time = time.perf_counter()
+        query_embeddings = get_query_embeddings(queries, self.store.model)
+        end_embedding_time = time.perf_counter()
 
-def generate_embeddings_and_save(string_list: List[str], filename: str, embedding_model=EMBEDDING_MODEL):
-    BATCH_SIZE = 5  # adjust as needed
-    embeddings = []
-    
-    for batch_start in range(0, len(string_list), BATCH_SIZE):
-        batch_end = batch_start + BATCH_SIZE
-        batch = string_list[batch_start:batch_end]
-        print(f"Batch {batch_start} to {batch_end-1}")
-        response = openai.Embedding.create(model=EMBEDDING_MODEL, input=batch)
-        for i, be in enumerate(response["data"]):
-            assert i == be["index"]  # double check embeddings are in same order as input
-        batch_embeddings = [e["embedding"] for e in response["data"]]
-        embeddings.extend(batch_embeddings)
-    
-    df = pd.DataFrame({"text": string_list, "embedding": embeddings})
-    save_path = f"/home/runner/StatuteSearch/streamlit/civix/embeddings_search/data/{filename}"
+        n_candidates = get_chunk_candidates(top_n, len(self.chunk_sections), len(self.section_texts))
+        if hasattr(self.search_engine, "search_batch") and len(queries):
+            indices, scores, timings = self.search_engine.search_batch(query_embeddings, top_n=n_candidates)
+        else:
+            # Engines without a batched search, e.g. the IVF index, search one query at a time
+            timings = {}
+            indices, scores = [], []
+            for query_embedding in query_embeddings:
+                query_indices, query_scores, query_timings = self.search_engine.search(query_embedding, top_n=n_candidates)
+                indices.append(query_indices)
+                scores.append(query_scores)
+                for phase, seconds in query_timings.items():
+                    timings[phase] = timings.get(phase, 0) + seconds
+        end_search_time = time.perf_counter()
+
+        results = []
+        for query_indices, query_scores in zip(indices, scores):
+            section_indices, section_scores = max_pool_ranked(query_indices, query_scores, self.chunk_sections, top_n)
+            results.append((
+                tuple(self.section_texts[i] for i in section_indices),
+                tuple(float(score) for score in section_scores),
+            ))
+
+        timings = {"embedding": end_embedding_time - start_embedding_time, **timings}
+        timings["pooling"] = time.perf_counter() - end_search_time
+        timings["total"] = time.perf_counter() - start_embedding_time
+        timings["per_query"] = timings["total"] / len(queries) if queries else 0.0
+        if return_timings:
+            return results, timings
+        return results
+
+    def get_bm25_index(self):
+        """Returns the BM25 index over the stored texts, loading or building it on first use."""
+        if self.bm25_index is None:
+            self.bm25_index = load_or_build_bm25_index(self.embedding_filename, self.store.texts, get_row_hashes(self.store))
+        return self.bm25_index
+
+    def get_section_graph(self):
+        """Returns the nearest-neighbour graph between the sections, loading or building it on first use."""
+        if self.section_graph is None:
+            chunked = len(self.chunk_sections) != len(self.section_texts)
+            self.section_graph = load_or_build_section_graph(
+                self.embedding_filename, self.store.embeddings, self.chunk_sections if chunked else None, len(self.section_texts))
+        return self.section_graph
 
-    # Create the directory if it doesn't exist
-    # TODO: getting FileNotFoundError
-    # Write DataFrame to the file
-    df.to_csv(save_path, index=False)
+    def get_related_sections(self, strings: List[str], top_n: int = NEIGHBOURS, exclude: Tuple[str] = ()) -> Tuple[Tuple[str], Tuple[float]]:
+        """
+        Returns the sections most similar to any of the given sections, sorted from most to
+        least similar, from the precomputed section graph. No embeddings API call or scoring
+        is made. The given sections and any in exclude are left out.
+        """
+        if self.section_ids is None:
+            self.section_ids = {text: i for i, text in enumerate(self.section_texts)}
+        graph = self.get_section_graph()
+        seeds = [self.section_ids[string] for string in strings if string in self.section_ids]
+        excluded = set(seeds) | {self.section_ids[string] for string in exclude if string in self.section_ids}
+
+        # A section linked from several seeds keeps its highest similarity
+        related = {}
+        for seed in seeds:
+            for neighbour, score in zip(*graph.get_neighbours(seed)):
+                if neighbour not in excluded and score > related.get(neighbour, -np.inf):
+                    related[neighbour] = float(score)
+        ranked = sorted(related.items(), key=lambda item: item[1], reverse=True)[:top_n]
+        return tuple(self.section_texts[i] for i, _ in ranked), tuple(score for _, score in ranked)
+
+    def strings_ranked_by_keywords(
+        self,
+        query: str,
+        top_n: int = 100,
+        print_time = False,
+        return_timings = False
+    ) -> tuple[list[str], list[float]]:
+        """
+        Returns the strings containing query terms and their BM25 scores, sorted from highest
+        to lowest. No embeddings API call is made. Same return layout as strings_ranked_by_relatedness.
+        """
+        start_time = time.perf_counter()
+        bm25_index = self.get_bm25_index()
+        indices, scores, timings = self.search_sections(lambda n: bm25_index.search(query, top_n=n), top_n)
+        strings = tuple(self.section_texts[i] for i in indices)
+        scores = tuple(float(score) for score in scores)
+        timings["total"] = time.perf_counter() - start_time
+
+        if print_time:
+            print(format_timings(timings))
+        if return_timings:
+            return strings, scores, timings
+        return strings, scores
+
+
+def create_search_engine(embedding_filename: str, embeddings, index_type: str = "exact", n_probe: int = 8, rerank: bool = True, groups: Optional[np.ndarray] = None):
+    """
+    Returns the search engine for a store. "exact" scores every vector; "ivf" uses the
+    approximate IVF index saved next to the store, where n_probe trades latency for recall;
+    "float16" and "int8" score quantized copies of the vectors, reranking the top candidates
+    at full precision if rerank is True; "sharded" scores every vector across worker
+    processes, splitting the rows between groups, e.g. acts, if groups are given.
+    """
+    if index_type == "exact":
+        return VectorSearchEngine(embeddings)
+    elif index_type == "ivf":
+        return load_or_build_ivf_index(embedding_filename, embeddings, n_probe=n_probe)
+    elif index_type in QUANTIZED_DTYPES:
+        return QuantizedSearchEngine(embeddings, dtype=index_type, rerank=rerank)
+    elif index_type == "sharded":
+        return ShardedSearchEngine(embeddings, groups=groups)
+    else:
+        raise ValueError(f"index_type must be one of {SEARCH_INDEX_TYPES}, got {index_type}")
+
+
+def sync_embeddings(string_list: List[str], filename: str, embedding_model=EMBEDDING_MODEL):
+    """
+    Brings the store for filename in line with string_list. Rows whose text hash matches a
+    string are reused, strings with no matching row are embedded, and rows for strings that
+    no longer exist are dropped. The store is only rewritten if something changed.
+
+    Returns:
+    Tuple[EmbeddingStore, dict]: The store, and counts of vectors reused, computed and removed.
+    """
+    hashes = [get_text_hash(string) for string in string_list]
+
+    try:
+        store = load_or_convert_store(filename)
+    except FileNotFoundError:
+        store = None
+
+    row_hashes = get_row_hashes(store) if store is not None and store.model == embedding_model else []
+    row_by_hash = {}
+    for row, row_hash in enumerate(row_hashes):
+        row_by_hash.setdefault(row_hash, row)
+
+    # Compared row by row, as duplicate texts, e.g. repeated "[Repealed]" sections, share one row_by_hash entry
+    if store is not None and row_hashes == hashes:
+        stats = {"reused": len(hashes), "computed": 0, "removed": 0}
+        print(f"Embeddings for {filename}: {stats}")
+        return store, stats
+
+    missing = [i for i, h in enumerate(hashes) if h not in row_by_hash]
+    new_embeddings = generate_embeddings([string_list[i] for i in missing], embedding_model, checkpoint_name=filename)
+
+    dim = new_embeddings.shape[1] if len(new_embeddings) else (store.dim if store is not None else 0)
+    embeddings = np.zeros((len(string_list), dim), dtype=np.float32)
+    for i, embedding in zip(missing, new_embeddings):
+        embeddings[i] = embedding
+    reused = [i for i, h in enumerate(hashes) if h in row_by_hash]
+    if reused:
+        embeddings[reused] = store.embeddings[[row_by_hash[hashes[i]] for i in reused]]
+
+    kept_hashes = set(hashes)
+    stats = {
+        "reused": len(reused),
+        "computed": len(missing),
+        "removed": sum(1 for row_hash in row_hashes if row_hash not in kept_hashes) if row_hashes else (len(store) if store is not None else 0),
+    }
+    print(f"Embeddings for {filename}: {stats}")
+
+    store = save_embedding_store(filename, string_list, embeddings, model=embedding_model)
+    return store, stats
+
+
+def generate_embeddings(string_list: List[str], embedding_model=EMBEDDING_MODEL, checkpoint_name: str = None) -> np.ndarray:
+    builder = EmbeddingBuilder(embedding_model=embedding_model)
+    return builder.build(string_list, checkpoint_name=checkpoint_name)
+
+
+def generate_embeddings_and_save(string_list: List[str], filename: str, embedding_model=EMBEDDING_MODEL):
+    embeddings = generate_embeddings(string_list, embedding_model, checkpoint_name=filename)
+    save_embedding_store(filename, string_list, embeddings, model=embedding_model)
 
@@ -0,0 +1,202 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_store import load_embedding_store, store_exists
+from .vector_search import VectorSearchEngine, normalize_rows, normalize_vector, score_candidates, select_top_k, select_top_k_rows
+
+
+# Quantized first-stage scoring. Vectors are normalized and stored as float16 (half the
+# memory of float32) or int8 (a quarter), with one float32 scale per row for int8. The
+# top candidates can then be rescored at full precision from the float32 store, which is
+# memory mapped and so only read for the rows being reranked.
+
+QUANTIZED_DTYPES = ("float16", "int8")
+SCORING_BLOCK_ROWS = 4096  # bounds the float32 copy made while scoring a block of rows
+RERANK_FACTOR = 4  # candidates reranked per result asked for
+
+
+def main():
+    if store_exists("corpus_sections"):
+        matrix = load_embedding_store("corpus_sections").embeddings
+    else:
+        print("No corpus index found, benchmarking on random vectors")
+        matrix = np.random.default_rng(0).normal(size=(20000, 256)).astype(np.float32)
+    print_benchmark(benchmark_quantization(matrix))
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-row scalar quantization. Returns the int8 matrix and the float32 scale of
+    each row, so that row i is approximately quantized[i] * scales[i].
+    """
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales[scales == 0] = 1
+    quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class QuantizedSearchEngine:
+    """
+    Cosine similarity search over float16 or int8 vectors. Same contract as VectorSearchEngine.
+
+    Parameters:
+    embeddings (np.ndarray): The full precision vectors, kept by reference for reranking.
+    dtype (str): "float16" or "int8".
+    rerank (bool): Whether to rescore the top candidates from the full precision vectors.
+    rerank_factor (int): How many candidates to rerank per result asked for.
+    """
+    def __init__(self, embeddings, dtype: str = "int8", rerank: bool = True, rerank_factor: int = RERANK_FACTOR):
+        if dtype not in QUANTIZED_DTYPES:
+            raise ValueError(f"dtype must be one of {QUANTIZED_DTYPES}, got {dtype}")
+        self.dtype = dtype
+        self.embeddings = embeddings
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+        self.scales = None
+
+        matrix = normalize_rows(embeddings) if len(embeddings) else np.zeros((0, 0), dtype=np.float32)
+        if dtype == "float16":
+            self.matrix = matrix.astype(np.float16)
+        else:
+            self.matrix, self.scales = quantize_int8(matrix)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def score(self, query_embedding, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Returns the approximate cosine similarity of the query to every stored vector, or only to the given rows."""
+        query = normalize_vector(query_embedding)
+        n_rows = len(self) if rows is None else len(rows)
+        scores = np.empty(n_rows, dtype=np.float32)
+        for start in range(0, n_rows, SCORING_BLOCK_ROWS):
+            end = start + SCORING_BLOCK_ROWS
+            block = self.matrix[start:end] if rows is None else self.matrix[rows[start:end]]
+            scores[start:end] = block.astype(np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales if rows is None else self.scales[rows]
+        return scores
+
+    def search(self, query_embedding, top_n: int = 100, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Returns the indices and cosine similarities of the top_n most similar vectors, sorted
+        from most to least similar, and a dictionary of phase timings in seconds. With rerank,
+        the returned similarities are full precision. With a boolean mask, only vectors where
+        the mask is True are considered.
+        """
+        start_scoring_time = time.perf_counter()
+        scores, candidates = score_candidates(self, query_embedding, mask)
+        end_scoring_time = time.perf_counter()
+
+        n_candidates = top_n * self.rerank_factor if self.rerank else top_n
+        selected = select_top_k(scores, n_candidates)
+        indices = selected if candidates is None else candidates[selected]
+        scores = scores[selected]
+        end_selection_time = time.perf_counter()
+
+        timings = {
+            "scoring": end_scoring_time - start_scoring_time,
+            "selection": end_selection_time - end_scoring_time,
+        }
+        if not self.rerank:
+            return indices, scores, timings
+
+        # Read the candidates in row order, which is sequential access on a memory mapped store
+        rows = np.sort(indices)
+        exact_scores = normalize_rows(self.embeddings[rows]) @ normalize_vector(query_embedding)
+        reranked = select_top_k(exact_scores, top_n)
+        timings["reranking"] = time.perf_counter() - end_selection_time
+        return rows[reranked], exact_scores[reranked], timings
+
+
+    def search_batch(self, query_embeddings, top_n: int = 100) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Searches several queries at once, scoring each block of rows against every query in
+        one product. Returns matrices of indices and similarities with one row per query.
+        """
+        start_scoring_time = time.perf_counter()
+        queries = normalize_rows(query_embeddings)
+        scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), SCORING_BLOCK_ROWS):
+            end = start + SCORING_BLOCK_ROWS
+            scores[:, start:end] = queries @ self.matrix[start:end].astype(np.float32).T
+        if self.scales is not None:
+            scores *= self.scales
+        end_scoring_time = time.perf_counter()
+
+        n_candidates = top_n * self.rerank_factor if self.rerank else top_n
+        indices = select_top_k_rows(scores, n_candidates)
+        end_selection_time = time.perf_counter()
+
+        timings = {
+            "scoring": end_scoring_time - start_scoring_time,
+            "selection": end_selection_time - end_scoring_time,
+        }
+        if not self.rerank:
+            return indices, np.take_along_axis(scores, indices, axis=1), timings
+
+        # Rescore every query's candidates from one read of the union of candidate rows
+        rows = np.unique(indices)
+        exact_scores = normalize_rows(self.embeddings[rows]) @ queries.T
+        candidate_scores = exact_scores[np.searchsorted(rows, indices), np.arange(queries.shape[0])[:, None]]
+        reranked = select_top_k_rows(candidate_scores, top_n)
+        timings["reranking"] = time.perf_counter() - end_selection_time
+        return np.take_along_axis(indices, reranked, axis=1), np.take_along_axis(candidate_scores, reranked, axis=1), timings
+
+
+def benchmark_quantization(embeddings, n_queries: int = 100, top_n: int = 10, noise: float = 0.02, seed: int = 0) -> List[dict]:
+    """
+    Measures the memory, recall@top_n against exact float32 search and mean latency of each
+    quantized storage type, with and without reranking. Queries are stored vectors with
+    Gaussian noise added, so no embeddings API calls are needed.
+
+    Returns:
+    List[dict]: One row per storage type and rerank setting.
+    """
+    rng = np.random.default_rng(seed)
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    queries = matrix[rng.choice(matrix.shape[0], min(n_queries, matrix.shape[0]), replace=False)]
+    queries = queries + rng.normal(scale=noise * np.abs(queries).mean(), size=queries.shape).astype(np.float32)
+
+    exact_engine = VectorSearchEngine(matrix)
+    start_time = time.perf_counter()
+    exact_results = [set(exact_engine.search(query, top_n)[0].tolist()) for query in queries]
+    exact_latency = (time.perf_counter() - start_time) / len(queries)
+
+    rows = []
+    for dtype in QUANTIZED_DTYPES:
+        for rerank in (False, True):
+            engine = QuantizedSearchEngine(matrix, dtype=dtype, rerank=rerank)
+            hits = 0
+            start_time = time.perf_counter()
+            for query, exact in zip(queries, exact_results):
+                indices, _, _ = engine.search(query, top_n)
+                hits += len(exact.intersection(indices.tolist()))
+            latency = (time.perf_counter() - start_time) / len(queries)
+            rows.append({
+                "dtype": dtype,
+                "rerank": rerank,
+                "recall": hits / (len(queries) * top_n),
+                "bytes": engine.nbytes,
+                "float32_bytes": exact_engine.nbytes,
+                "bytes_saved": exact_engine.nbytes - engine.nbytes,
+                "latency_ms": latency * 1000,
+                "exact_latency_ms": exact_latency * 1000,
+            })
+    return rows
+
+
+def print_benchmark(rows: List[dict]):
+    for row in rows:
+        print(f"{row['dtype']:8s} rerank {str(row['rerank']):5s}  recall {row['recall']:.3f}  "
+              f"memory {row['bytes'] / 2**20:.1f} MiB (saves {row['bytes_saved'] / 2**20:.1f} of {row['float32_bytes'] / 2**20:.1f} MiB)  "
+              f"latency {row['latency_ms']:.3f} ms  exact {row['exact_latency_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
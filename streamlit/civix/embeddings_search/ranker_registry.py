@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from .embedding_store import get_current_version
+from .new_search import EMBEDDING_MODEL, TextRanker
+from .quantization import QUANTIZED_DTYPES
+
+
+# A process-wide registry of loaded TextRankers, keyed by embedding file and index type.
+# Every user asking about the same statute shares one loaded index instead of reloading
+# it per question. Least recently used rankers are evicted once the registry is over its
+# byte budget, which can be set with TEXT_RANKER_REGISTRY_BYTES in the environment. Keys
+# include the index version, so once a new version is published new queries load rankers
+# from it and the old version's rankers are dropped; queries holding them finish unaffected.
+
+DEFAULT_MAX_BYTES = int(os.environ.get("TEXT_RANKER_REGISTRY_BYTES", 512 * 1024 * 1024))
+
+
+class TextRankerRegistry:
+    """
+    LRU cache of TextRankers under a byte budget. Safe to share between threads.
+
+    Parameters:
+    max_bytes (int): The most memory the cached rankers may hold. The most recently used
+    ranker is always kept, even if it alone is larger than the budget.
+    """
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.rankers = OrderedDict()
+        self.sizes = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, embedding_filename: str, strings: List[str], embedding_model: str = EMBEDDING_MODEL, index_type: str = "exact", n_probe: int = 8, rerank: bool = True) -> TextRanker:
+        """
+        Returns the cached ranker for an embedding file, building one on a miss. A cached
+        ranker built from different strings, e.g. after the statute was amended, is replaced.
+        """
+        key = (get_current_version(), embedding_filename, index_type, embedding_model)
+        with self.lock:
+            text_ranker = self.rankers.get(key)
+            if text_ranker is not None and (not strings or text_ranker.strings == strings):
+                self.rankers.move_to_end(key)
+                if index_type == "ivf":
+                    text_ranker.search_engine.n_probe = n_probe
+                elif index_type in QUANTIZED_DTYPES:
+                    text_ranker.search_engine.rerank = rerank
+                self.stats["hits"] += 1
+                return text_ranker
+            self.stats["misses"] += 1
+
+        # Built outside the lock so one slow load doesn't block queries on other statutes
+        text_ranker = TextRanker(embedding_filename, strings, embedding_model=embedding_model, index_type=index_type, n_probe=n_probe, rerank=rerank)
+        self.put(key, text_ranker)
+        return text_ranker
+
+    def put(self, key, text_ranker: TextRanker):
+        current_version = get_current_version()
+        with self.lock:
+            # Rankers of other index versions are no longer served
+            for stale_key in [stale_key for stale_key in self.rankers if stale_key[0] != current_version]:
+                del self.rankers[stale_key]
+                del self.sizes[stale_key]
+            if key[0] != current_version:
+                # A new version was published while this ranker loaded
+                return
+            self.rankers[key] = text_ranker
+            self.rankers.move_to_end(key)
+            self.sizes[key] = text_ranker.nbytes
+            while len(self.rankers) > 1 and self.nbytes > self.max_bytes:
+                evicted_key, _ = self.rankers.popitem(last=False)
+                del self.sizes[evicted_key]
+                self.stats["evictions"] += 1
+
+    def remove(self, embedding_filename: str):
+        """Drops every cached ranker for an embedding file."""
+        with self.lock:
+            for key in [key for key in self.rankers if key[1] == embedding_filename]:
+                del self.rankers[key]
+                del self.sizes[key]
+
+    def clear(self):
+        with self.lock:
+            self.rankers.clear()
+            self.sizes.clear()
+
+    def __len__(self):
+        return len(self.rankers)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.sizes.values())
+
+    def get_footprint(self) -> Dict[str, object]:
+        """Returns the number of cached rankers, their total and per-file bytes, the budget and hit counts."""
+        with self.lock:
+            footprint = dict(self.stats)
+            footprint["entries"] = len(self.rankers)
+            footprint["bytes"] = self.nbytes
+            footprint["max_bytes"] = self.max_bytes
+            footprint["rankers"] = {f"{key[1]} ({key[2]})": size for key, size in self.sizes.items()}
+        return footprint
+
+
+_default_registry = None
+
+
+def get_default_ranker_registry() -> TextRankerRegistry:
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = TextRankerRegistry()
+    return _default_registry
+
+
+def get_text_ranker(embedding_filename: str, strings: List[str], registry: Optional[TextRankerRegistry] = None, **kwargs) -> TextRanker:
+    """Returns a shared TextRanker for an embedding file from the process-wide registry."""
+    registry = registry or get_default_ranker_registry()
+    return registry.get(embedding_filename, strings, **kwargs)
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .embedding_cache import normalize_query
+
+
+# Caches the outcome of ranking a statute's sections for a question, so the same question
+# about the same act, asked again in any session, skips fetching and parsing the statute,
+# embedding the query, ranking and the LLM call for top headings. Keys are the act id, the
+# catalog currency date, so a new catalog never serves stale results, and the normalized
+# query. Entries hold only ranked section ids, scores and headings; the section texts are
+# read back from the statute's TextRanker and the statute Markdown rebuilt from its outline.
+# Entries expire after QUERY_RESULT_CACHE_TTL seconds.
+
+DEFAULT_TTL = float(os.environ.get("QUERY_RESULT_CACHE_TTL", 60 * 60))
+MAX_ENTRIES = 1024
+
+
+class QueryResult:
+    """
+    What is kept of one query's results.
+
+    Parameters:
+    embedding_filename (str): The embedding file of the statute's TextRanker.
+    outline (List[Tuple[str, str]]): The statute's headings and section numbers, from get_statute_outline.
+    section_numbers (List[str]): The statute's section numbers, in the order of the ranker's sections.
+    section_ids (List[int]): The ranker's section indices, best first.
+    relatedness (List[float]): The score of each ranked section.
+    top_headings (List[str]): The section numbers and headings chosen as top headings.
+    index_version (str): The index version the ranking was made on.
+    """
+    __slots__ = ("embedding_filename", "outline", "section_numbers", "section_ids", "relatedness", "top_headings", "index_version", "created")
+
+    def __init__(self, embedding_filename: str, outline: List[Tuple[str, str]], section_numbers: List[str], section_ids: List[int], relatedness: List[float], top_headings: List[str], index_version: Optional[str] = None):
+        self.embedding_filename = embedding_filename
+        self.outline = tuple(outline)
+        self.section_numbers = tuple(section_numbers)
+        self.section_ids = tuple(section_ids)
+        self.relatedness = tuple(relatedness)
+        self.top_headings = tuple(top_headings)
+        self.index_version = index_version
+        self.created = time.time()
+
+
+class QueryResultCache:
+    """
+    LRU cache of query results with a time to live. Safe to share between threads.
+
+    Parameters:
+    ttl (float): Seconds an entry is served for after it is stored.
+    max_entries (int): The most entries kept; the least recently used are evicted first.
+    """
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    @staticmethod
+    def get_key(act_id: str, currency_date: Optional[str], query: str) -> Tuple[str, Optional[str], str]:
+        return (act_id, currency_date, normalize_query(query))
+
+    def get(self, act_id: str, currency_date: Optional[str], query: str) -> Optional[QueryResult]:
+        key = self.get_key(act_id, currency_date, query)
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.stats["misses"] += 1
+                return None
+            if time.time() - result.created > self.ttl:
+                del self.entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return result
+
+    def put(self, act_id: str, currency_date: Optional[str], query: str, result: QueryResult):
+        key = self.get_key(act_id, currency_date, query)
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def remove(self, act_id: str):
+        """Drops every entry for an act, e.g. after its embeddings are rebuilt."""
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == act_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {**self.stats, "entries": len(self.entries)}
+
+
+_default_result_cache = None
+
+
+def get_default_result_cache() -> QueryResultCache:
+    """Returns the process-wide query result cache, creating it on first use."""
+    global _default_result_cache
+    if _default_result_cache is None:
+        _default_result_cache = QueryResultCache()
+    return _default_result_cache
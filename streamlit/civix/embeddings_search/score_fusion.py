@@ -0,0 +1,131 @@
+from typing import Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .vector_search import select_top_k
+
+
+# Combines several rankings of the same items (dense similarity, BM25, an LLM's chosen
+# order) into one. A signal is a ranked list of integer item ids, best first, with optional
+# scores; a signal without scores contributes by rank alone. Items a signal did not return
+# get nothing from it. Everything is done on NumPy arrays sized to the item count.
+
+FUSION_METHODS = ("weighted", "rrf")
+RRF_K = 60  # the usual reciprocal rank fusion constant; larger values flatten the rank curve
+
+
+def normalize_min_max(scores) -> np.ndarray:
+    """Scales scores to [0, 1]. A signal whose scores are all equal maps to 1."""
+    scores = np.asarray(scores, dtype=np.float32)
+    if scores.size == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def get_rank_scores(n: int) -> np.ndarray:
+    """Returns scores falling linearly from 1 for the first item to 0 for the last."""
+    if n == 1:
+        return np.ones(1, dtype=np.float32)
+    return np.linspace(1, 0, n, dtype=np.float32)
+
+
+def weighted_min_max_fusion(signals: Sequence[Tuple[np.ndarray, Optional[np.ndarray]]], weights: Sequence[float], n_items: int) -> np.ndarray:
+    """Returns the fused score of every item: the weighted sum of each signal's min-max normalized scores."""
+    fused = np.zeros(n_items, dtype=np.float32)
+    for (ids, scores), weight in zip(signals, weights):
+        ids = np.asarray(ids, dtype=np.int64)
+        if ids.size == 0:
+            continue
+        normalized = normalize_min_max(scores) if scores is not None else get_rank_scores(ids.size)
+        fused[ids] += weight * normalized
+    return fused
+
+
+def reciprocal_rank_fusion(signals: Sequence[Tuple[np.ndarray, Optional[np.ndarray]]], weights: Sequence[float], n_items: int, k: int = RRF_K) -> np.ndarray:
+    """Returns the fused score of every item: the weighted sum of 1 / (k + rank) over the signals that returned it."""
+    fused = np.zeros(n_items, dtype=np.float32)
+    for (ids, _), weight in zip(signals, weights):
+        ids = np.asarray(ids, dtype=np.int64)
+        fused[ids] += weight / (k + np.arange(1, ids.size + 1, dtype=np.float32))
+    return fused
+
+
+def fuse_rankings(
+    signals: Sequence[Tuple[np.ndarray, Optional[np.ndarray]]],
+    n_items: int,
+    weights: Optional[Sequence[float]] = None,
+    method: str = "rrf",
+    top_n: Optional[int] = None,
+    k: int = RRF_K,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuses ranked signals over the item ids 0..n_items-1.
+
+    Parameters:
+    signals (Sequence[Tuple[np.ndarray, Optional[np.ndarray]]]): (ids, scores) pairs, ids sorted best first.
+    n_items (int): The number of items the ids refer to.
+    weights (Optional[Sequence[float]]): One weight per signal. Defaults to equal weights.
+    method (str): "weighted" for weighted min-max blending, "rrf" for reciprocal rank fusion.
+    top_n (Optional[int]): How many items to return. Defaults to every item any signal returned.
+    k (int): The reciprocal rank fusion constant.
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: The item ids and fused scores, sorted from best to worst.
+    """
+    weights = weights if weights is not None else [1.0] * len(signals)
+    if len(weights) != len(signals):
+        raise ValueError(f"Expected {len(signals)} weights, got {len(weights)}")
+
+    if method == "weighted":
+        fused = weighted_min_max_fusion(signals, weights, n_items)
+    elif method == "rrf":
+        fused = reciprocal_rank_fusion(signals, weights, n_items, k)
+    else:
+        raise ValueError(f"method must be one of {FUSION_METHODS}, got {method}")
+
+    returned = np.zeros(n_items, dtype=bool)
+    for ids, _ in signals:
+        returned[np.asarray(ids, dtype=np.int64)] = True
+    candidates = np.flatnonzero(returned)
+    order = select_top_k(fused[candidates], top_n if top_n is not None else candidates.size)
+    ids = candidates[order]
+    return ids, fused[ids]
+
+
+def fuse_ranked_lists(
+    ranked_lists: Sequence[Tuple[Sequence[Hashable], Optional[Sequence[float]]]],
+    weights: Optional[Sequence[float]] = None,
+    method: str = "rrf",
+    top_n: Optional[int] = None,
+    k: int = RRF_K,
+) -> Tuple[List[Hashable], List[float]]:
+    """
+    Fuses rankings of items given as values rather than ids, e.g. section strings from
+    TextRanker and section headings chosen by the LLM. Same parameters as fuse_rankings.
+    Items are matched by equality; an item repeated within one list counts at its best rank.
+
+    Returns:
+    Tuple[List[Hashable], List[float]]: The items and fused scores, sorted from best to worst.
+    """
+    item_ids = {}
+    signals = []
+    for items, scores in ranked_lists:
+        ids = []
+        kept_scores = []
+        seen = set()
+        for position, item in enumerate(items):
+            item_id = item_ids.setdefault(item, len(item_ids))
+            if item_id in seen:
+                continue
+            seen.add(item_id)
+            ids.append(item_id)
+            if scores is not None:
+                kept_scores.append(scores[position])
+        signals.append((np.array(ids, dtype=np.int64), np.array(kept_scores, dtype=np.float32) if scores is not None else None))
+
+    items = list(item_ids)
+    ids, fused = fuse_rankings(signals, len(items), weights=weights, method=method, top_n=top_n, k=k)
+    return [items[i] for i in ids], fused.tolist()
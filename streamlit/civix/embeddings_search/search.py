@@ -1,22 +1,28 @@
-import ast  # for converting embeddings saved as strings back to arrays
 import os
 import time
+from typing import List, Tuple
 
 # from generate_embeddings import generate_embeddings
 
 
-import openai  # for calling the OpenAI API
+import numpy as np  # for vectorized similarity search
 import pandas as pd  # for storing text and embeddings data
 # import tiktoken  # for counting tokens
-from scipy import spatial  # for calculating vector similarities for search
+
+from .embedding_backends import DEFAULT_EMBEDDING_MODEL
+from .embedding_cache import get_query_embedding
+from .embedding_store import EmbeddingStore, get_store_base_path, load_or_convert_store
+from .vector_search import VectorSearchEngine, format_timings
 
 
 # Following tutorial from here: https://github.com/openai/openai-cookbook/blob/main/examples/Question_answering_using_embeddings.ipynb
 
 
-EMBEDDING_MODEL = "text-embedding-ada-002"  # OpenAI's best embeddings as of Apr 2023
+EMBEDDING_MODEL = DEFAULT_EMBEDDING_MODEL  # text-embedding-ada-002 unless set in the environment
 GPT_MODEL = "gpt-3.5-turbo"
 
+_store_engines = {}  # store base path -> (store file mtime, store, engine)
+
 
 def main():
     # TODO move from other file in here?
@@ -39,11 +45,9 @@ def test_get_law_names_by_relatedness():
 def get_law_names_by_relatedness(
     query: str, 
     top_n=10):
-    df = get_df_by_filename("statute_name_embeddings.csv")
-    
-    strings, relatedness = strings_ranked_by_relatedness(
+    strings, relatedness = strings_ranked_in_store(
         query=query,
-        df=df,
+        filename="statute_name_embeddings",
         top_n=top_n)
 
     return strings, relatedness
@@ -51,51 +55,90 @@ def get_law_names_by_relatedness(
 # TODO combine so can check for embedding existing and if it doesn't exist, create it, run the query, and return the result of strings_ranked_by_relatedness
 
 def get_df_by_filename(filename):
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    embeddings_dir = os.path.join(current_dir, "data")
-    embeddings_path = os.path.join(embeddings_dir, filename)
-
+    # A bare name, so the store resolves in the current index version
     try:
-        df = load_embeddings(embeddings_path)
+        df = load_embeddings(filename)
         return df
-    except Exception:
-        raise ValueError(f"Filepath {embeddings_path} does not exist in {current_dir}")
+    except FileNotFoundError:
+        raise ValueError(f"Filepath {get_store_base_path(filename)} does not exist")
 
 
 def load_embeddings(path):
-    df = pd.read_csv(path)
-    df['embedding'] = df['embedding'].apply(ast.literal_eval)
-    return df
+    # Memory maps the binary store, converting a legacy CSV on first load
+    store = load_or_convert_store(path)
+    return store.to_dataframe()
+
+
+def get_store_search_engine(filename: str) -> Tuple[EmbeddingStore, VectorSearchEngine]:
+    """
+    Returns a store and a search engine over its normalized vectors, built once per store
+    and rebuilt when the store file is replaced or a new index version is published.
+    """
+    base = get_store_base_path(filename)
+    cached = _store_engines.get(base)
+    if cached is not None and os.path.exists(f"{base}.npy") and cached[0] == os.stat(f"{base}.npy").st_mtime_ns:
+        return cached[1], cached[2]
+    store = load_or_convert_store(filename)
+    engine = VectorSearchEngine(store.embeddings)
+    _store_engines[base] = (os.stat(f"{base}.npy").st_mtime_ns, store, engine)
+    return store, engine
+
+
+def strings_ranked_in_store(
+    query: str,
+    filename: str,
+    top_n: int = 100,
+    print_time = False,
+    return_timings = False
+):
+    """Like strings_ranked_by_relatedness over the store filename, reusing its search engine across queries."""
+    start_index_time = time.perf_counter()
+    store, engine = get_store_search_engine(filename)
+    return rank_strings(query, store.texts, engine, store.model, top_n, print_time, return_timings, time.perf_counter() - start_index_time)
 
 
 def strings_ranked_by_relatedness(
     query: str,
     df: pd.DataFrame,
-    relatedness_fn=lambda x, y: 1 - spatial.distance.cosine(x, y),
     top_n: int = 100,
-    print_time = False
+    print_time = False,
+    return_timings = False
 ) -> tuple[list[str], list[float]]:
-    """Returns a list of strings and relatednesses, sorted from most related to least."""
-    start_embedding_time = time.time()
-    query_embedding_response = openai.Embedding.create(
-        model=EMBEDDING_MODEL,
-        input=query,
-    )
-    query_embedding = query_embedding_response["data"][0]["embedding"]
-    end_embedding_time = time.time()
-    
-    start_search_time = time.time()
-    strings_and_relatednesses = [
-        (row["text"], relatedness_fn(query_embedding, row["embedding"]))
-        for i, row in df.iterrows()
-    ]
-    strings_and_relatednesses.sort(key=lambda x: x[1], reverse=True)
-    end_search_time = time.time()
+    """
+    Returns a list of strings and relatednesses, sorted from most related to least.
+    With return_timings=True also returns a dictionary of per-phase timings in seconds.
+    This normalizes the whole DataFrame for one query; to query a store repeatedly use strings_ranked_in_store.
+    """
+    start_index_time = time.perf_counter()
+    engine = VectorSearchEngine(np.stack(df["embedding"].to_numpy()) if len(df) else [])
+    index_time = time.perf_counter() - start_index_time
+    return rank_strings(query, df["text"].tolist(), engine, df.attrs.get("model", EMBEDDING_MODEL), top_n, print_time, return_timings, index_time)
+
+
+def rank_strings(query: str, texts: List[str], engine: VectorSearchEngine, model: str, top_n: int, print_time: bool, return_timings: bool, index_time: float):
+    """Ranks texts, the rows of engine, by relatedness to query. index_time is the time taken to get the engine."""
+    start_embedding_time = time.perf_counter()
+    # Queries must be embedded by the same model as the stored vectors
+    query_embedding = get_query_embedding(query, model)
+    end_embedding_time = time.perf_counter()
+
+    indices, scores, search_timings = engine.search(query_embedding, top_n=top_n)
+
+    strings = tuple(texts[i] for i in indices)
+    relatednesses = tuple(float(score) for score in scores)
+
+    timings = {
+        "embedding": end_embedding_time - start_embedding_time,
+        "indexing": index_time,
+        **search_timings,
+    }
+    timings["total"] = time.perf_counter() - start_embedding_time + index_time
 
     if print_time:
-        print(f"Embedding time: {end_embedding_time - start_embedding_time}\nSearch time: {end_search_time - start_search_time}")
-    strings, relatednesses = zip(*strings_and_relatednesses)
-    return strings[:top_n], relatednesses[:top_n]
+        print(format_timings(timings))
+    if return_timings:
+        return strings, relatednesses, timings
+    return strings, relatednesses
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,153 @@
+import os
+import sys
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .chunking import load_chunk_map
+from .embedding_store import get_index_dir, get_store_base_path, load_embedding_store
+from .vector_search import normalize_rows, select_top_k_rows
+
+
+# Precomputed k-nearest-neighbour graph between sections. Row i of the adjacency array holds
+# the ids of the k sections most similar to section i, best first, with their similarities
+# alongside as float16, so finding related provisions is an O(k) lookup with no scoring.
+# Within a statute the graph links sections of the same act; over the corpus index it can
+# be restricted to sections of other acts. Chunked sections are linked by the mean direction
+# of their chunks. Build every statute's graph, and with --corpus the corpus graph, offline with:
+#   python -m streamlit.civix.embeddings_search.section_graph [--corpus]
+
+NEIGHBOURS = 10
+BLOCK_ROWS = 1024  # rows scored at once while building, bounding memory to BLOCK_ROWS x n scores
+SKIPPED_STORES = ("statute_name_embeddings",)
+
+
+def main():
+    from .corpus_index import CORPUS_INDEX_NAME as corpus_name
+    for filename in sorted(os.listdir(get_index_dir())):
+        if not filename.endswith(".npy") or filename.endswith(".chunks.npy"):
+            continue
+        name = filename[:-len(".npy")]
+        if name in SKIPPED_STORES or name == corpus_name:
+            continue
+        store = load_embedding_store(name)
+        chunk_map = load_chunk_map(name)
+        chunk_sections, section_texts = chunk_map if chunk_map is not None else (None, store.texts)
+        graph = load_or_build_section_graph(name, store.embeddings, chunk_sections, len(section_texts))
+        print(f"{name}: {len(graph)} sections, {graph.nbytes} bytes")
+
+    if "--corpus" in sys.argv and os.path.exists(f"{get_store_base_path(corpus_name)}.npy"):
+        store = load_embedding_store(corpus_name)
+        graph = build_corpus_section_graph(store, corpus_name)
+        print(f"{corpus_name}: {len(graph)} vectors, {graph.nbytes} bytes")
+
+
+def get_section_vectors(embeddings, chunk_sections: Optional[np.ndarray], n_sections: int) -> np.ndarray:
+    """Returns one unit vector per section, the mean direction of its chunks for chunked sections."""
+    if chunk_sections is None:
+        return normalize_rows(embeddings)
+    sums = np.zeros((n_sections, embeddings.shape[1]), dtype=np.float32)
+    np.add.at(sums, chunk_sections, normalize_rows(embeddings))
+    return normalize_rows(sums)
+
+
+def build_knn(vectors: np.ndarray, k: int = NEIGHBOURS, groups: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the k nearest neighbours of every unit vector by cosine similarity, excluding
+    itself, as an int32 id matrix and a float16 similarity matrix. With groups, a vector's
+    neighbours are only taken from other groups. Rows with fewer than k candidates are
+    padded with id -1.
+    """
+    n = vectors.shape[0]
+    neighbours = np.full((n, k), -1, dtype=np.int32)
+    similarities = np.zeros((n, k), dtype=np.float16)
+    for start in range(0, n, BLOCK_ROWS):
+        end = min(start + BLOCK_ROWS, n)
+        scores = vectors[start:end] @ vectors.T
+        rows = np.arange(end - start)
+        scores[rows, rows + start] = -np.inf
+        if groups is not None:
+            scores[groups[start:end, None] == groups[None, :]] = -np.inf
+        top = select_top_k_rows(scores, k)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        valid = np.isfinite(top_scores)
+        neighbours[start:end, :top.shape[1]] = np.where(valid, top, -1)
+        similarities[start:end, :top.shape[1]] = np.where(valid, top_scores, 0)
+    return neighbours, similarities
+
+
+class SectionGraph:
+    """Adjacency array of each section's nearest neighbours."""
+    def __init__(self, neighbours: np.ndarray, similarities: np.ndarray):
+        self.neighbours = neighbours
+        self.similarities = similarities
+
+    @classmethod
+    def build(cls, embeddings, chunk_sections: Optional[np.ndarray] = None, n_sections: Optional[int] = None, k: int = NEIGHBOURS, groups: Optional[np.ndarray] = None) -> "SectionGraph":
+        n_sections = n_sections if n_sections is not None else len(embeddings)
+        vectors = get_section_vectors(embeddings, chunk_sections, n_sections)
+        return cls(*build_knn(vectors, k, groups))
+
+    def __len__(self):
+        return self.neighbours.shape[0]
+
+    @property
+    def k(self) -> int:
+        return self.neighbours.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.neighbours.nbytes + self.similarities.nbytes
+
+    def get_neighbours(self, section: int, k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the ids and similarities of up to k sections most similar to a section, best first."""
+        neighbours = self.neighbours[section, :k]
+        valid = neighbours >= 0
+        return neighbours[valid], self.similarities[section, :k][valid].astype(np.float32)
+
+    def save(self, path: str):
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(f, neighbours=self.neighbours, similarities=self.similarities)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "SectionGraph":
+        with np.load(path) as data:
+            return cls(data["neighbours"], data["similarities"])
+
+
+def get_section_graph_path(filename: str) -> str:
+    return f"{get_store_base_path(filename)}.knn.npz"
+
+
+def load_or_build_section_graph(filename: str, embeddings, chunk_sections: Optional[np.ndarray] = None, n_sections: Optional[int] = None, k: int = NEIGHBOURS, groups: Optional[np.ndarray] = None) -> SectionGraph:
+    """
+    Loads the section graph saved next to an embedding store, or builds and saves one if it
+    is missing, older than the store, has fewer than k neighbours or a different number of sections.
+    """
+    path = get_section_graph_path(filename)
+    store_path = f"{get_store_base_path(filename)}.npy"
+    n_sections = n_sections if n_sections is not None else len(embeddings)
+    if os.path.exists(path) and (not os.path.exists(store_path) or os.path.getmtime(path) >= os.path.getmtime(store_path)):
+        graph = SectionGraph.load(path)
+        if len(graph) == n_sections and graph.k >= k:
+            return graph
+
+    graph = SectionGraph.build(embeddings, chunk_sections, n_sections, k, groups)
+    graph.save(path)
+    return graph
+
+
+def build_corpus_section_graph(store, filename: str, k: int = NEIGHBOURS, other_acts_only: bool = True) -> SectionGraph:
+    """Builds and saves the graph over every vector of the corpus index, linking only sections of different acts by default."""
+    groups = None
+    if other_acts_only:
+        act_codes = {}
+        groups = np.array([act_codes.setdefault(row["act_id"], len(act_codes)) for row in store.metadata], dtype=np.int32)
+    graph = SectionGraph.build(store.embeddings, k=k, groups=groups)
+    graph.save(get_section_graph_path(filename))
+    return graph
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .vector_search import VectorSearchEngine, normalize_rows, normalize_vector, select_top_k
+
+
+# Scatter-gather exact search over an index split into shards of contiguous rows, cut at
+# statute boundaries when a group (act) is given for each row. The normalized vectors are
+# written once to a shared memory block, so the worker processes read them without copies
+# and the app process holds no private copy. A query is sent to every shard at once, each
+# worker returns its shard's top-k, and the per-shard lists are merged into the global top-k.
+# Workers come from one process-wide pool of SEARCH_WORKERS processes, so scoring runs on
+# several cores while the app process only merges.
+
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", os.cpu_count() or 1))
+MIN_SHARD_ROWS = 4096  # smaller shards cost more in messaging than they save in scoring
+BLOCK_ROWS = 65536  # rows normalized at once while filling shared memory
+MAX_ATTACHED_ENGINES = 64  # shard engines each worker keeps attached to shared memory
+
+
+def main():
+    benchmark_sharded_search()
+
+
+def get_shard_bounds(n_rows: int, n_shards: int, groups: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Returns the first row of each shard followed by n_rows. Shards are near equal in rows,
+    with every cut moved to the nearest start of a group so no group is split across shards.
+    """
+    n_shards = max(1, min(n_shards, -(-n_rows // MIN_SHARD_ROWS)))
+    targets = np.linspace(0, n_rows, n_shards + 1).round().astype(np.int64)
+    if groups is not None and n_rows:
+        group_starts = np.concatenate([[0], np.flatnonzero(groups[1:] != groups[:-1]) + 1, [n_rows]])
+        positions = np.clip(np.searchsorted(group_starts, targets), 1, len(group_starts) - 1)
+        before, after = group_starts[positions - 1], group_starts[positions]
+        targets = np.where(targets - before <= after - targets, before, after)
+    targets[0], targets[-1] = 0, n_rows
+    return np.unique(targets)
+
+
+# ---------- In the worker processes ---------- #
+_attached_engines = OrderedDict()
+
+
+def get_shard_engine(shm_name: str, shape: Tuple[int, int], start: int, end: int) -> VectorSearchEngine:
+    """Returns an engine over rows start to end of a shared memory block, attaching to it on first use."""
+    key = (shm_name, start, end)
+    if key in _attached_engines:
+        _attached_engines.move_to_end(key)
+        return _attached_engines[key][1]
+    shm = shared_memory.SharedMemory(name=shm_name)
+    matrix = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)[start:end]
+    _attached_engines[key] = (shm, VectorSearchEngine.from_normalized(matrix))
+    while len(_attached_engines) > MAX_ATTACHED_ENGINES:
+        _, (evicted_shm, evicted_engine) = _attached_engines.popitem(last=False)
+        evicted_engine.matrix = None
+        evicted_shm.close()
+    return _attached_engines[key][1]
+
+
+def search_shard(shm_name: str, shape: Tuple[int, int], start: int, end: int, query_embedding: np.ndarray, top_n: int, packed_mask: Optional[np.ndarray]):
+    start_time = time.perf_counter()
+    engine = get_shard_engine(shm_name, shape, start, end)
+    mask = np.unpackbits(packed_mask, count=end - start).astype(bool) if packed_mask is not None else None
+    indices, scores, _ = engine.search(query_embedding, top_n=top_n, mask=mask)
+    return indices + start, scores, time.perf_counter() - start_time
+
+
+def search_shard_batch(shm_name: str, shape: Tuple[int, int], start: int, end: int, query_embeddings: np.ndarray, top_n: int):
+    start_time = time.perf_counter()
+    engine = get_shard_engine(shm_name, shape, start, end)
+    indices, scores, _ = engine.search_batch(query_embeddings, top_n=top_n)
+    return indices + start, scores, time.perf_counter() - start_time
+
+
+# ---------- In the app process ---------- #
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_search_pool() -> ProcessPoolExecutor:
+    """Returns the process-wide pool of search workers, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned rather than forked, as the app process runs threads
+            _pool = ProcessPoolExecutor(max_workers=SEARCH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def release_shared_memory(shm: shared_memory.SharedMemory):
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class ShardedSearchEngine:
+    """
+    Exact cosine similarity search spread over worker processes. Same interface as
+    VectorSearchEngine.
+
+    Parameters:
+    embeddings: The vectors, e.g. a memory-mapped store matrix. They are normalized into shared memory.
+    n_shards (int): How many shards to split the rows into, at most one per MIN_SHARD_ROWS rows.
+    groups (np.ndarray): Optional group of each row, e.g. an act code, kept whole within a shard. Rows of a group must be contiguous.
+    """
+    def __init__(self, embeddings, n_shards: int = SEARCH_WORKERS, groups: Optional[np.ndarray] = None):
+        n_rows = len(embeddings)
+        dim = embeddings.shape[1] if n_rows else 0
+        self.shape = (n_rows, dim)
+        self.bounds = get_shard_bounds(n_rows, n_shards, groups)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(n_rows * dim * 4, 1))
+        # Removes the block when the engine is garbage collected or the process exits
+        self.finalizer = weakref.finalize(self, release_shared_memory, self.shm)
+        matrix = np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)
+        for start in range(0, n_rows, BLOCK_ROWS):
+            matrix[start:start + BLOCK_ROWS] = normalize_rows(embeddings[start:start + BLOCK_ROWS])
+        del matrix
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def n_shards(self) -> int:
+        return len(self.bounds) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return self.shape[0] * self.shape[1] * 4
+
+    def close(self):
+        """Releases the shared memory. Workers drop their views of it as they attach to other indexes."""
+        self.finalizer()
+
+    def scatter(self, function, *args) -> List:
+        pool = get_search_pool()
+        futures = [
+            pool.submit(function, self.shm.name, self.shape, int(start), int(end), *(arg(start, end) if callable(arg) else arg for arg in args))
+            for start, end in zip(self.bounds[:-1], self.bounds[1:])
+        ]
+        return [future.result() for future in futures]
+
+    def search(self, query_embedding, top_n: int = 100, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Returns the indices and cosine similarities of the top_n most similar vectors across
+        all shards, sorted from most to least similar, and the phase timings in seconds.
+        With a boolean mask, only vectors where the mask is True are considered.
+        """
+        start_time = time.perf_counter()
+        if not len(self) or (mask is not None and not mask.any()):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), {"scatter": 0.0, "merge": 0.0}
+        query_embedding = normalize_vector(query_embedding)
+        shard_mask = (lambda start, end: np.packbits(mask[start:end])) if mask is not None else None
+        results = self.scatter(search_shard, query_embedding, top_n, shard_mask)
+        end_scatter_time = time.perf_counter()
+
+        indices = np.concatenate([result[0] for result in results])
+        scores = np.concatenate([result[1] for result in results])
+        selected = select_top_k(scores, top_n)
+        timings = {
+            "scatter": end_scatter_time - start_time,
+            "shard_scoring": max(result[2] for result in results),
+            "merge": time.perf_counter() - end_scatter_time,
+        }
+        return indices[selected], scores[selected], timings
+
+    def search_batch(self, query_embeddings, top_n: int = 100) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """Searches several queries in each shard with one matrix-matrix product, merging each query's rows as in search."""
+        start_time = time.perf_counter()
+        queries = normalize_rows(query_embeddings)
+        if not len(self):
+            empty = np.empty((queries.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32), {"scatter": 0.0, "merge": 0.0}
+        results = self.scatter(search_shard_batch, queries, top_n)
+        end_scatter_time = time.perf_counter()
+
+        indices = np.concatenate([result[0] for result in results], axis=1)
+        scores = np.concatenate([result[1] for result in results], axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :top_n]
+        timings = {
+            "scatter": end_scatter_time - start_time,
+            "shard_scoring": max(result[2] for result in results),
+            "merge": time.perf_counter() - end_scatter_time,
+        }
+        return np.take_along_axis(indices, order, axis=1), np.take_along_axis(scores, order, axis=1), timings
+
+
+def benchmark_sharded_search(n_rows: int = 200000, dim: int = 1536, n_queries: int = 20, top_n: int = 10):
+    """Compares sharded search with exact search in one process on random vectors."""
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((n_rows, dim), dtype=np.float32)
+    queries = rng.standard_normal((n_queries, dim), dtype=np.float32)
+    exact = VectorSearchEngine(embeddings)
+    sharded = ShardedSearchEngine(embeddings)
+    sharded.search(queries[0], top_n)  # starts the workers
+
+    for name, engine in (("exact", exact), (f"sharded ({sharded.n_shards} shards)", sharded)):
+        start_time = time.perf_counter()
+        results = [engine.search(query, top_n)[0] for query in queries]
+        elapsed = (time.perf_counter() - start_time) / n_queries
+        print(f"{name}: {elapsed * 1000:.2f} ms per query")
+    expected = [exact.search(query, top_n)[0] for query in queries]
+    print(f"Same results as exact: {all(np.array_equal(a, b) for a, b in zip(expected, results))}")
+    sharded.close()
+
+
+if __name__ == "__main__":
+    main()
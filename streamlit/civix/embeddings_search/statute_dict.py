@@ -226,27 +226,62 @@ def create_title_markdown(statute_dict):
     return title_md
 
 
-def create_statute_markdown(statute_dict):
-    statute_md = create_title_markdown(statute_dict)
-    
+def get_statute_outline(statute_dict) -> List[Tuple[str, str]]:
+    """
+    Returns the statute's section numbers in document order, each paired with the title,
+    part and division headings in Markdown that come before it. Headings after the last
+    section are paired with None.
+    """
+    outline = []
+    headings_md = create_title_markdown(statute_dict)
+
+    def add_sections(section_numbers):
+        nonlocal headings_md
+        for section_number in section_numbers:
+            outline.append((headings_md, section_number))
+            headings_md = ""
+
     if "parts" in statute_dict:
         for part in statute_dict["parts"]:
-            statute_md += f'## {part["part_number"]} {part["part_title"]}\n\n'
+            headings_md += f'## {part["part_number"]} {part["part_title"]}\n\n'
             if part["divisions"]:
                 for division in part["divisions"]:
-                    statute_md += f'### {division["division_number"]} {division["division_title"]}\n\n'
-                    for section_number in division["sections"]:
-                        statute_md += f'{create_section_markdown(statute_dict["sections"][section_number])}\n\n'
+                    headings_md += f'### {division["division_number"]} {division["division_title"]}\n\n'
+                    add_sections(division["sections"])
             else:
-                for section_number in part["sections"]:
-                    statute_md += f'{create_section_markdown(statute_dict["sections"][section_number])}\n\n'
+                add_sections(part["sections"])
     else:
-        for section_number, section_content in statute_dict["sections"].items():
-            statute_md += f'{create_section_markdown(section_content)}\n\n'
-            
+        add_sections(statute_dict["sections"])
+
+    if headings_md:
+        outline.append((headings_md, None))
+    return outline
+
+
+def create_markdown_from_outline(outline: List[Tuple[str, str]], section_markdown: Dict[str, str]) -> str:
+    """Joins an outline from get_statute_outline with the Markdown of each section into the statute's Markdown."""
+    statute_md = ""
+    for headings_md, section_number in outline:
+        statute_md += headings_md
+        if section_number is not None:
+            statute_md += f'{section_markdown[section_number]}\n\n'
     return statute_md
 
 
+def create_statute_markdown(statute_dict, section_markdown: Dict[str, str] = None):
+    """
+    Returns the statute as Markdown. Pass section_markdown, section number to Markdown, to
+    reuse sections already converted instead of converting them again.
+    """
+    outline = get_statute_outline(statute_dict)
+    if section_markdown is None:
+        section_markdown = {
+            section_number: create_section_markdown(statute_dict["sections"][section_number])
+            for _, section_number in outline if section_number is not None
+        }
+    return create_markdown_from_outline(outline, section_markdown)
+
+
 def test_get_and_markdown():
     statute_dict = get_statute_dict_from_url("https://www.bclaws.gov.bc.ca/civix/document/id/complete/statreg/96253_01")
     print(statute_dict)
@@ -0,0 +1,142 @@
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+# With a filter mask selecting fewer than this fraction of rows, only the selected rows are
+# scored; above it, scoring every row in one product and discarding the rest is faster.
+GATHER_FRACTION = 0.3
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Returns a float32 copy of matrix with every row scaled to unit length. Zero rows are left as zeros."""
+    matrix = np.array(matrix, dtype=np.float32, copy=True, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    matrix /= norms
+    return matrix
+
+
+def normalize_vector(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def select_top_k(scores: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    Returns the indices of the top_n highest scores, sorted from highest to lowest.
+    Uses argpartition so only the selected candidates are sorted, not the whole array.
+    """
+    top_n = min(top_n, scores.shape[0])
+    if top_n <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_n < scores.shape[0]:
+        candidates = np.argpartition(-scores, top_n - 1)[:top_n]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def select_top_k_rows(scores: np.ndarray, top_n: int) -> np.ndarray:
+    """Returns the indices of the top_n highest scores in each row of a matrix, each row sorted from highest to lowest."""
+    n_rows, n_columns = scores.shape
+    top_n = min(top_n, n_columns)
+    if top_n <= 0:
+        return np.empty((n_rows, 0), dtype=np.int64)
+    if top_n < n_columns:
+        candidates = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+    else:
+        candidates = np.tile(np.arange(n_columns), (n_rows, 1))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class VectorSearchEngine:
+    """
+    Exact cosine similarity search. Vectors are normalized once when the engine is built
+    and kept as one contiguous float32 matrix, so a query is a single matrix-vector
+    product followed by a partial sort of the scores.
+    """
+    def __init__(self, embeddings):
+        self.matrix = normalize_rows(embeddings) if len(embeddings) else np.zeros((0, 0), dtype=np.float32)
+
+    @classmethod
+    def from_normalized(cls, matrix: np.ndarray) -> "VectorSearchEngine":
+        """Wraps a float32 matrix of unit rows without copying it, e.g. a view on shared memory."""
+        engine = cls.__new__(cls)
+        engine.matrix = matrix
+        return engine
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def score(self, query_embedding, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Returns the cosine similarity of the query to every stored vector, or only to the given rows."""
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        return matrix @ normalize_vector(query_embedding)
+
+    def search(self, query_embedding, top_n: int = 100, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Returns the indices and cosine similarities of the top_n most similar vectors,
+        sorted from most to least similar, and a dictionary of phase timings in seconds.
+        With a boolean mask, only vectors where the mask is True are considered.
+        """
+        start_scoring_time = time.perf_counter()
+        scores, candidates = score_candidates(self, query_embedding, mask)
+        end_scoring_time = time.perf_counter()
+
+        selected = select_top_k(scores, top_n)
+        indices = selected if candidates is None else candidates[selected]
+        end_selection_time = time.perf_counter()
+
+        timings = {
+            "scoring": end_scoring_time - start_scoring_time,
+            "selection": end_selection_time - end_scoring_time,
+        }
+        return indices, scores[selected], timings
+
+
+    def search_batch(self, query_embeddings, top_n: int = 100) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Searches several queries with one matrix-matrix product. Returns matrices of indices
+        and similarities with one row per query, each sorted as in search, and the timings.
+        """
+        start_scoring_time = time.perf_counter()
+        queries = normalize_rows(query_embeddings)
+        scores = queries @ self.matrix.T if len(self) else np.zeros((queries.shape[0], 0), dtype=np.float32)
+        end_scoring_time = time.perf_counter()
+
+        indices = select_top_k_rows(scores, top_n)
+        end_selection_time = time.perf_counter()
+
+        timings = {
+            "scoring": end_scoring_time - start_scoring_time,
+            "selection": end_selection_time - end_scoring_time,
+        }
+        return indices, np.take_along_axis(scores, indices, axis=1), timings
+
+
+def score_candidates(engine, query_embedding, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Scores the rows of an engine selected by mask. Returns the scores and the row index of
+    each score, or the scores of every row and None without a mask.
+    """
+    if mask is None:
+        scores = engine.score(query_embedding) if len(engine) else np.zeros(0, dtype=np.float32)
+        return scores, None
+    candidates = np.flatnonzero(mask)
+    if candidates.size == 0:
+        return np.zeros(0, dtype=np.float32), candidates
+    if candidates.size <= len(engine) * GATHER_FRACTION:
+        return engine.score(query_embedding, candidates), candidates
+    return engine.score(query_embedding)[candidates], candidates
+
+
+def format_timings(timings: Dict[str, float]) -> str:
+    return "\n".join(f"{phase.capitalize()} time: {seconds:.6f}" for phase, seconds in timings.items())
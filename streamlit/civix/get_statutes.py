@@ -2,6 +2,7 @@
 import string
 import re
 import json
+import os
 from datetime import datetime
 import requests
 import pandas as pd
@@ -9,8 +10,9 @@ import pandas as pd
 import streamlit as st
 from bs4 import BeautifulSoup
 
-from civix.content import get_directory_by_letter, extract_document_info, get_act_id
-from civix.data import get_statute_currency_date
+from civix.content import get_directory_by_letter, get_letter_directories, extract_document_info, get_act_id
+from civix.data import get_statute_currency_date, get_statute_json_filepath, load_statute_dictionary
+from civix.catalog_format import get_catalog_path, write_catalog
 
 
 # ----------------------- TODO --------------------------- #
@@ -20,6 +22,16 @@ from civix.data import get_statute_currency_date
 
 
 # ----------------------- END TODO ------------------------ #
+
+# Incremental refresh: each letter's directory listing is saved alongside the all_statutes
+# file it produced, as {letter: {title: [directory_id, repealed]}} in a .listings.json file.
+# refresh_all_statutes fetches the listings again and calls get_act_id, two or three CIVIX
+# requests per statute, only for entries whose directory id, title or repealed status is not
+# in the previous catalog; unchanged entries keep their previous act id. The statutes added,
+# repealed, retitled or removed since the previous catalog are written to a .changes.json report.
+
+LISTINGS_EXTENSION = ".listings.json"
+CHANGES_EXTENSION = ".changes.json"
 # OLD FROM WHEN THIS WAS STREAMLIT PAGE
 def main():
 
@@ -40,6 +52,10 @@ def main():
     if st.button("Get all statutes"):
         all_statutes = get_all_statutes()
         st.write(all_statutes)
+
+    if st.button("Refresh statutes"):
+        all_statutes, changes = refresh_all_statutes()
+        st.write(changes)
         
 
 
@@ -52,21 +68,113 @@ def get_all_statutes():
     """
 
     all_statutes = []
+    listings = {}
 
     for letter in string.ascii_uppercase:
         print(letter)
         directory_url = get_directory_by_letter(letter)
         if directory_url is not None:
             document_info = extract_document_info(directory_url, exclude_repealed=False)
+            listings[letter] = document_info
             processed_info = process_document_info(document_info)
             all_statutes.extend(processed_info)
         else:
             print(None)
-    save_all_statutes(all_statutes)
+    save_all_statutes(all_statutes, listings)
     return all_statutes
 
 
-def save_all_statutes(all_statutes):
+def refresh_all_statutes():
+    """
+    Like get_all_statutes, but resolves act ids only for directory entries that are new or
+    changed since the previous all_statutes file, and saves a report of the changes with it.
+    Falls back to get_all_statutes if there is no previous file.
+    Returns the list of statute dictionaries and the changes, as from get_statute_changes.
+    """
+    try:
+        previous_statutes = load_statute_dictionary()
+    except FileNotFoundError:
+        all_statutes = get_all_statutes()
+        return all_statutes, get_statute_changes([], all_statutes)
+    previous_filepath = get_statute_json_filepath()
+    previous_listings = load_listings(previous_filepath)
+    previous_by_directory_id = {statute["directory_id"]: statute for statute in previous_statutes}
+
+    # One request for every letter's directory, rather than one per letter
+    letter_directories = get_letter_directories()
+    all_statutes = []
+    listings = {}
+    act_id_lookups = 0
+    for letter in string.ascii_uppercase:
+        directory_url = letter_directories.get(letter)
+        if directory_url is None:
+            print(f"{letter}: no directory")
+            continue
+        document_info = extract_document_info(directory_url, exclude_repealed=False)
+        listings[letter] = document_info
+        if previous_listings is not None and previous_listings.get(letter) == document_info:
+            print(f"{letter}: unchanged")
+        processed_info, lookups = process_document_info(document_info, previous_by_directory_id, return_lookups=True)
+        act_id_lookups += lookups
+        all_statutes.extend(processed_info)
+
+    changes = get_statute_changes(previous_statutes, all_statutes)
+    changes["previous_file"] = os.path.basename(previous_filepath)
+    changes["act_id_lookups"] = act_id_lookups
+    print(f"{len(changes['added'])} added, {len(changes['repealed'])} repealed, {len(changes['retitled'])} retitled, {len(changes['removed'])} removed; {act_id_lookups} act id lookups")
+    save_all_statutes(all_statutes, listings, changes)
+    return all_statutes, changes
+
+
+def get_statute_changes(previous_statutes, all_statutes):
+    """
+    Compares two lists of statute dictionaries by directory id. Returns a dictionary of the
+    statutes "added" (in force and not in the previous list), "repealed" (in force before and
+    repealed now, under the same or a new directory id with the same citation), "retitled"
+    (in force in both under a different name, with the "previous_name") and "removed"
+    (in force before and missing now).
+    """
+    by_directory_id = {statute["directory_id"]: statute for statute in all_statutes}
+    previous_directory_ids = {statute["directory_id"] for statute in previous_statutes}
+    repealed_citations = {statute["citation"] for statute in all_statutes if statute["repealed"]}
+
+    changes = {"added": [], "repealed": [], "retitled": [], "removed": []}
+    for statute in all_statutes:
+        if not statute["repealed"] and statute["directory_id"] not in previous_directory_ids:
+            changes["added"].append(statute)
+    for previous in previous_statutes:
+        if previous["repealed"]:
+            continue
+        statute = by_directory_id.get(previous["directory_id"])
+        if statute is None:
+            if previous["citation"] in repealed_citations:
+                changes["repealed"].append(previous)
+            else:
+                changes["removed"].append(previous)
+        elif statute["repealed"]:
+            changes["repealed"].append(statute)
+        elif statute["name"] != previous["name"]:
+            changes["retitled"].append({**statute, "previous_name": previous["name"]})
+    return changes
+
+
+def load_listings(json_filename):
+    """Returns the directory listings saved with an all_statutes file, or None if there are none."""
+    listings_filename = f"{os.path.splitext(json_filename)[0]}{LISTINGS_EXTENSION}"
+    if not os.path.exists(listings_filename):
+        return None
+    with open(listings_filename, "r") as f:
+        listings = json.load(f)
+    # Back to the {title: (directory_id, repealed)} form of extract_document_info
+    return {letter: {title: tuple(entry) for title, entry in document_info.items()} for letter, document_info in listings.items()}
+
+
+def save_all_statutes(all_statutes, listings=None, changes=None):
+    """
+    Saves statutes to a timestamped all_statutes json file, with its binary catalog, a csv, and
+    optionally the directory listings they came from and a report of changes.
+    Returns the json filename.
+    """
     # Get the current timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
@@ -80,38 +188,61 @@ def save_all_statutes(all_statutes):
     with open(json_filename, 'w') as f:
         json.dump(all_statutes, f)
 
+    # And the binary catalog the apps load at startup
+    write_catalog(get_catalog_path(json_filename), all_statutes)
+
+    # The directory listings for the next refresh, and the changes since the previous file
+    base_filename = os.path.splitext(json_filename)[0]
+    if listings is not None:
+        with open(f"{base_filename}{LISTINGS_EXTENSION}", 'w') as f:
+            json.dump(listings, f)
+    if changes is not None:
+        with open(f"{base_filename}{CHANGES_EXTENSION}", 'w') as f:
+            json.dump(changes, f, indent=2)
     
     # Convert to dataframe and save to CSV
     csv_filename = f"civix/data/all_statutes_{timestamp}_{num_records}records.csv"
     df = pd.DataFrame(all_statutes)
     df.to_csv(csv_filename, index=False)
     
-    print(f"Data saved to {json_filename}, {csv_filename}")
+    print(f"Data saved to {json_filename}, {get_catalog_path(json_filename)}, {csv_filename}")
+    return json_filename
 
 # NOTE and TODO added skipping of None items with code
 # Hasn't been tested
 # Reason that items with no Act ID (one instance, which had regs) are of no use for the purposes I'm using this for
-def process_document_info(document_info):
+def process_document_info(document_info, previous_statutes=None, return_lookups=False):
     """
     Processes the document information dictionary and returns a list of dictionaries with the desired format.
     Args:
          A dictionary mapping document titles to tuples containing document IDs and repealed status.
+         previous_statutes: Optionally, previous statute dictionaries by directory id. An entry with the same
+                            name, citation and repealed status keeps its previous act id without calling get_act_id.
+         return_lookups: Whether to also return the number of get_act_id calls made.
     Returns:
         A list of dictionaries with the following format:
                                            [{"name": ..., "citation": ..., "directory_id": ..., "act_id": ..., "repealed": ..., "url": ...}]
     """
     # Process document_info dictionary and create the output list of dictionaries.
     output = []
+    lookups = 0
     for title, (doc_id, repealed) in document_info.items():
         
         name, citation = extract_name_and_citation(title)
-        print(name, end=", ")
-        act_document_id = get_act_id(doc_id)
+        previous = previous_statutes.get(doc_id) if previous_statutes else None
+        if previous is not None and (previous["name"], previous["citation"], previous["repealed"]) == (name, citation, repealed):
+            act_document_id = previous["act_id"]
+        else:
+            print(name, end=", ")
+            act_document_id = get_act_id(doc_id)
+            lookups += 1
         # Skip this item if the act_document_id is None
         if act_document_id is None:
             continue
         output.append({"name": name, "citation": citation, "directory_id": doc_id, "act_id": act_document_id, "repealed": repealed, "url": f"http://www.bclaws.gov.bc.ca/civix/document/id/complete/statreg/{act_document_id}"})
     print()
+    if return_lookups:
+        return output, lookups
     return output
 
 
@@ -1,15 +1,18 @@
 from typing import List, Optional
 # Very CLUNKY and needs to be fixed so can be run from anywhere
 try:
-    from civix.data import load_statute_dictionary
+    from civix.data import fold_value, get_statute_catalog
+    from civix.catalog_search import CONFIDENT_FUZZY_SCORE, get_catalog_search
 except Exception:
-    from data import load_statute_dictionary
+    from data import fold_value, get_statute_catalog
+    from catalog_search import CONFIDENT_FUZZY_SCORE, get_catalog_search
 
 
 def get_statute_dict_by_info(info: str, exclude_repealed: bool=False) -> Optional[dict]:
     """
     Retrieves a statute dictionary from a list of statute dictionaries by searching for a match in the 'name', 'citation', 
-    or 'act_id' fields. The match is case-insensitive. If exclude_repealed is True, only statutes that have not been repealed will be returned.
+    or 'act_id' fields. The match is case-insensitive. Failing an exact match, the one statute whose name or citation info is a
+    prefix of (preferring the version in force), or for typos a confident fuzzy match, is returned, as in catalog_search.py. If exclude_repealed is True, only statutes that have not been repealed will be returned.
 
     Parameters:
     info (str): The information (name, citation, or act_id) to be matched.
@@ -19,8 +22,21 @@ def get_statute_dict_by_info(info: str, exclude_repealed: bool=False) -> Optiona
     dict: A dictionary containing the matched statute's information.
           If no matching statute is found, returns None.
     """
-    data = load_statute_dictionary()
-    statute = get_dictionary(data, info, exclude_repealed)
+    # An index lookup in the shared catalog rather than a scan of every statute
+    statute = get_statute_catalog().find(info, include_repealed=not exclude_repealed)
+    if statute is None:
+        # Otherwise an unambiguous name or citation: equal but for punctuation, that of the one statute
+        # info is a prefix of, or for a typo a confident fuzzy match. Word prefixes and substrings are too loose
+        matches = get_catalog_search().search(info, top_n=None, include_repealed=not exclude_repealed)
+        records = get_statute_catalog().records
+        prefix_statutes = [records[position] for position, kind, _ in matches if kind == "prefix"]
+        if matches and matches[0][1] == "exact":
+            statute = records[matches[0][0]]
+        elif len({fold_value(record["name"]) for record in prefix_statutes}) == 1:
+            # One statute, though possibly as a repealed record and its current version, which is preferred
+            statute = min(prefix_statutes, key=lambda record: record["repealed"])
+        elif matches and matches[0][1] == "fuzzy" and matches[0][2] >= CONFIDENT_FUZZY_SCORE:
+            statute = records[matches[0][0]]
     if statute:
         return statute
     else:
@@ -31,6 +47,7 @@ def get_dictionary(data: List[dict], value: str, exclude_repealed: bool=False) -
     """
     Retrieves a dictionary from a list of dictionaries by searching for a case-insensitive match in the 'name', 'citation', 
     or 'act_id' fields. If exclude_repealed is True, only dictionaries that have not been repealed will be returned.
+    This scans the list; to look up the catalog use StatuteCatalog.find in data.py, which uses its indexes.
 
     Parameters:
     data (List[dict]): The list of dictionaries to search.
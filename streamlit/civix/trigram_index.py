@@ -0,0 +1,86 @@
+import re
+import unicodedata
+from typing import List, Set, Tuple
+
+import numpy as np
+
+
+# Character trigram index for matching short strings such as statute names despite typos,
+# missing words or partial names. Each string is indexed by the set of three-character
+# sequences in its normalized form; a query scores every string by the trigrams they share,
+# counted with one bincount over the query's postings.
+
+
+def normalize_text(text: str) -> str:
+    """Casefolds, normalizes unicode and reduces punctuation to single spaces."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return re.sub(r"[^\w]+", " ", text).strip()
+
+
+def get_trigrams(text: str) -> Set[str]:
+    """Returns the trigrams of each word of text, padded so word starts and ends are trigrams too."""
+    trigrams = set()
+    for word in normalize_text(text).split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+class TrigramIndex:
+    """
+    Inverted index from trigrams to string ids, stored as flat arrays: the ids containing
+    trigram t are ids[offsets[t]:offsets[t + 1]].
+
+    A string scores the mean of two ratios of shared trigrams: to the query's trigrams, so a
+    partial name like "tenancy" still matches "Residential Tenancy Act" strongly, and to
+    the average of both trigram counts (the Dice coefficient), so closer full matches rank first.
+    """
+    def __init__(self, strings: List[str]):
+        self.strings = list(strings)
+        postings = {}
+        self.lengths = np.zeros(len(self.strings), dtype=np.int32)
+        for string_id, string in enumerate(self.strings):
+            trigrams = get_trigrams(string)
+            self.lengths[string_id] = len(trigrams)
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(string_id)
+
+        self.trigram_ids = {trigram: trigram_id for trigram_id, trigram in enumerate(postings)}
+        sizes = [len(ids) for ids in postings.values()]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self.ids = np.fromiter((i for ids in postings.values() for i in ids), dtype=np.int32, count=int(self.offsets[-1]))
+
+    def __len__(self):
+        return len(self.strings)
+
+    @property
+    def nbytes(self) -> int:
+        return self.lengths.nbytes + self.offsets.nbytes + self.ids.nbytes
+
+    def score(self, query: str) -> np.ndarray:
+        """Returns the similarity of the query to every string, from 0 (no shared trigrams) to 1."""
+        query_trigrams = get_trigrams(query)
+        if not query_trigrams or not len(self):
+            return np.zeros(len(self), dtype=np.float32)
+        postings = [
+            self.ids[self.offsets[trigram_id]:self.offsets[trigram_id + 1]]
+            for trigram_id in (self.trigram_ids.get(trigram) for trigram in query_trigrams)
+            if trigram_id is not None
+        ]
+        if not postings:
+            return np.zeros(len(self), dtype=np.float32)
+        shared = np.bincount(np.concatenate(postings), minlength=len(self)).astype(np.float32)
+        containment = shared / len(query_trigrams)
+        dice = 2 * shared / (len(query_trigrams) + self.lengths)
+        return (containment + dice) / 2
+
+    def search(self, query: str, top_n: int = 10, min_score: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the ids and scores of the top_n strings scoring above min_score, sorted from best to worst."""
+        if top_n <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = self.score(query)
+        candidates = np.flatnonzero(scores > min_score)
+        if candidates.size > top_n:
+            candidates = candidates[np.argpartition(-scores[candidates], top_n - 1)[:top_n]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return candidates, scores[candidates]
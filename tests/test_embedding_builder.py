@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from streamlit.civix.embeddings_search.embedding_builder import EmbeddingBuilder
+
+MODEL = "local-hashing-64"
+STRINGS = [f"Section {i}: text of section {i}" for i in range(7)]
+
+
+def interrupt_build(builder: EmbeddingBuilder, fail_after: int):
+    """Runs a checkpointed build whose requests fail after fail_after succeed, leaving a partial checkpoint."""
+    request_embeddings = builder.request_embeddings
+    calls = []
+
+    def failing_request(batch, tokens):
+        calls.append(batch)
+        if len(calls) > fail_after:
+            raise RuntimeError("interrupted")
+        return request_embeddings(batch, tokens)
+
+    builder.request_embeddings = failing_request
+    with pytest.raises(RuntimeError):
+        builder.build(STRINGS, checkpoint_name="statute")
+
+
+def test_resume_with_same_packing_uses_checkpoint(tmp_path):
+    expected = EmbeddingBuilder(MODEL, max_workers=1).build(STRINGS)
+    interrupt_build(EmbeddingBuilder(MODEL, max_workers=1, max_inputs_per_request=2, checkpoints_dir=str(tmp_path)), fail_after=2)
+
+    builder = EmbeddingBuilder(MODEL, max_workers=1, max_inputs_per_request=2, checkpoints_dir=str(tmp_path))
+    requested = []
+    request_embeddings = builder.request_embeddings
+    builder.request_embeddings = lambda batch, tokens: requested.append(batch) or request_embeddings(batch, tokens)
+    np.testing.assert_allclose(builder.build(STRINGS, checkpoint_name="statute"), expected)
+    assert len(requested) == 2  # the two batches not in the checkpoint
+    assert not list(tmp_path.iterdir())
+
+
+def test_resume_with_different_packing_discards_checkpoint(tmp_path):
+    expected = EmbeddingBuilder(MODEL, max_workers=1).build(STRINGS)
+    interrupt_build(EmbeddingBuilder(MODEL, max_workers=1, max_inputs_per_request=2, checkpoints_dir=str(tmp_path)), fail_after=2)
+
+    # Batches of 3 instead of 2: the saved batches would give rows the wrong embeddings
+    builder = EmbeddingBuilder(MODEL, max_workers=1, max_inputs_per_request=3, checkpoints_dir=str(tmp_path))
+    np.testing.assert_allclose(builder.build(STRINGS, checkpoint_name="statute"), expected)
+    assert not list(tmp_path.iterdir())